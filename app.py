@@ -1,16 +1,27 @@
+import hashlib
+
 import dash
 import dash_bootstrap_components as dbc
-import pandas as pd
-from visualizations import (create_histograms, create_platform_pie, create_job_title_bar_chart, generate_choropleth_map,
-                            create_skill_table, create_salary_bar_chart)
-from data_processing import load_data, process_data_optimized, load_skill_dataset, parse_skills
+import flask
+from visualizations import (create_platform_pie, create_job_title_bar_chart, generate_choropleth_map,
+                            create_skill_table, create_salary_bar_chart, create_skill_pie, create_salary_histogram)
+from data_processing import job_title_counts, query_salary_cube, search_listings, search_page, skills_for_rows
+import dataset_registry
+import query_backend
+import figure_assets
+import figure_cache
+import metrics
+import refresh
+import startup
 from layout import get_layout
 from dash.dependencies import Input, Output, State
-from data_processing import des_categories_by_level, des_categories_by_domain
+from data_processing import SALARY_PERCENTILES, des_categories_by_level, des_categories_by_domain
 from dash import dcc, html
-import plotly.express as px
 from dash.exceptions import PreventUpdate
 
+# Number of result cards rendered per page of search results
+SEARCH_PAGE_SIZE = 50
+
 # Initialize the Dash app
 app = dash.Dash(
     __name__,
@@ -21,38 +32,97 @@ app = dash.Dash(
     suppress_callback_exceptions=True
 )
 
-# Load and process data
-df = load_data()
-filtered_df = df[df['salary'] != 'Not specified']
-df_processed = process_data_optimized(filtered_df.copy())
-# Combine job categories for dropdown
-all_jobs = list(des_categories_by_level.keys()) + list(des_categories_by_domain.keys())
-unique_jobs = list(set(all_jobs))  # Remove duplicates
-
-# Load the dataset on app initialization
-top_hard_skills_by_domain = load_skill_dataset('skills_datasets/top_hard_skills_by_domain.csv')
-top_hard_skills_by_level = load_skill_dataset('skills_datasets/top_hard_skills_by_level.csv')
-top_soft_skills_by_domain = load_skill_dataset('skills_datasets/top_soft_skills_by_domain.csv')
-top_soft_skills_by_level = load_skill_dataset('skills_datasets/top_soft_skills_by_level.csv')
-hard_skill_domain_tables = create_skill_table(top_hard_skills_by_domain, "Hard Skill", "Domain")
-hard_skill_level_tables = create_skill_table(top_hard_skills_by_level, "Hard Skill", "Level")
-soft_skill_domain_tables = create_skill_table(top_soft_skills_by_domain, "Soft Skill", "Domain")
-soft_skill_level_tables = create_skill_table(top_soft_skills_by_level, "Soft Skill", "Level")
-
-# Home page
-top_10_hard_skills = pd.read_csv('skills_datasets/top_10_hard_skills.csv')
-top_10_soft_skills = pd.read_csv('skills_datasets/top_10_soft_skills.csv')
-
-# Create visualizations
-fig, fig_domain = create_histograms(df_processed)
-fig_platform = create_platform_pie(df)
-
-fig_platform.update_layout(
-    paper_bgcolor="#282c31",
-    plot_bgcolor="#282c31",
-    font=dict(color="#e9ecef"),
-)
-choropleth_map = generate_choropleth_map(df)
+
+def build_skill_tables():
+    # Skill rankings are derived from the live listings, in the same shape as the files under skills_datasets/
+    skill_rankings = dataset_registry.get('skill_rankings')
+    return {
+        'hard_domain': create_skill_table(skill_rankings['top_hard_skills_by_domain'], "Hard Skill", "Domain"),
+        'hard_level': create_skill_table(skill_rankings['top_hard_skills_by_level'], "Hard Skill", "Level"),
+        'soft_domain': create_skill_table(skill_rankings['top_soft_skills_by_domain'], "Soft Skill", "Domain"),
+        'soft_level': create_skill_table(skill_rankings['top_soft_skills_by_level'], "Soft Skill", "Level"),
+    }
+
+
+dataset_registry.register('skill_tables', build_skill_tables, depends=['skill_rankings'])
+
+# Figures only change with the registry artifacts they are built from, so each is rebuilt only when those change
+home_figures = {
+    'home-hard-skills': lambda: create_skill_pie(dataset_registry.get('skill_rankings')['top_10_hard_skills'],
+                                                 'Top 10 Hard Skills', ['#636EFA', '#EF553B', '#00CC96', '#AB63FA']),
+    'home-soft-skills': lambda: create_skill_pie(dataset_registry.get('skill_rankings')['top_10_soft_skills'],
+                                                 'Top 10 Soft Skills', ['#19D3F3', '#FF6692', '#B6E880', '#FF97FF']),
+    'home-salary-ranges': lambda: create_salary_bar_chart(dataset_registry.get('salary_range_counts')),
+}
+page_figures = {
+    'platform': lambda: create_platform_pie(dataset_registry.get('platform_counts')),
+    'usa-map': lambda: generate_choropleth_map(dataset_registry.get('state_aggregates')),
+}
+figure_dependencies = {
+    'home-hard-skills': ['skill_rankings'],
+    'home-soft-skills': ['skill_rankings'],
+    'home-salary-ranges': ['salary_range_counts'],
+    'platform': ['platform_counts'],
+    'usa-map': ['state_aggregates'],
+}
+
+# Build the dataset artifacts and figures in parallel, following their dependencies
+startup_stages = dataset_registry.stages()
+startup_stages['home_figures'] = (['skill_rankings', 'salary_range_counts'],
+                                  lambda: figure_cache.warm(home_figures, figure_dependencies))
+startup_stages['platform_figure'] = (['platform_counts'], lambda: figure_cache.get_figure(
+    'platform', page_figures['platform'], figure_dependencies['platform']))
+startup_stages['usa_map_figure'] = (['state_aggregates'], lambda: figure_cache.get_figure(
+    'usa-map', page_figures['usa-map'], figure_dependencies['usa-map']))
+# Graphs that show one of these figures load it in the browser from the exported asset, see figure_assets.py
+static_figures = {**home_figures, **page_figures}
+static_graphs = {
+    'pie-chart-hard-skills': 'home-hard-skills',
+    'pie-chart-soft-skills': 'home-soft-skills',
+    'bar-chart-salary-ranges': 'home-salary-ranges',
+    'platform-graph': 'platform',
+    'usa-map-graph': 'usa-map',
+}
+startup_stages['figure_assets'] = (['home_figures', 'platform_figure', 'usa_map_figure'],
+                                   lambda: figure_assets.export(static_figures, figure_dependencies))
+home_stages = ['home_figures', 'job_options', 'location_options']
+if startup.DEFER_STARTUP:
+    startup_targets = home_stages
+elif query_backend.ENABLED:
+    # The filter callbacks query the database, so the cube and search index are never needed
+    startup_targets = [name for name in startup_stages if name not in ('salary_cube', 'search_index')]
+else:
+    startup_targets = None
+startup.run(startup_stages, targets=startup_targets)
+if not startup.DEFER_STARTUP:
+    dataset_registry.release_row_frames()  # Only with the query backend; deferred stages may still need them
+dataset_registry.cleanup()  # Cache files left behind by earlier runs
+figure_assets.serve(app, static_figures, figure_dependencies)
+
+
+# Each request reads one dataset version from start to end, even when a background refresh swaps in a new one
+@app.server.before_request
+def pin_dataset():
+    flask.g.previous_dataset = dataset_registry.pin()
+
+
+@app.server.teardown_request
+def unpin_dataset(exc):
+    dataset_registry.unpin(flask.g.pop('previous_dataset', None))
+
+
+# Rebuild everything startup built whenever the source changes, off the request path; see refresh.py
+refresh.start(startup_stages, targets=startup_targets)
+
+for graph_id, figure_name in static_graphs.items():
+    # Fires when the graph is added to the page; the figure itself never goes through Python
+    app.clientside_callback(
+        f"function(_, urls) {{ return window.dash_clientside.figures.load(urls, "
+        f"'{app.get_relative_path(figure_assets.URL_PREFIX + 'manifest.json')}', '{figure_name}'); }}",
+        Output(graph_id, 'figure'),
+        Input(graph_id, 'id'),
+        State('figure-urls', 'data')
+    )
 
 
 # Callback to update the active link based on the current pathname
@@ -84,20 +154,37 @@ def update_active_link(pathname):
         return [base_class, base_class, base_class, base_class, base_class]
 
 
+# Registry artifacts the memoized callbacks below read: their results stay cached until one of these changes
+if query_backend.ENABLED:
+    job_title_depends = histogram_depends = search_depends = ['query_db']
+else:
+    job_title_depends = ['listings']
+    histogram_depends = ['salary_cube']
+    search_depends = ['search_index', 'listings', 'skills']
+
+
+def count_job_titles(column, selected_category):
+    if query_backend.ENABLED:
+        return query_backend.job_title_counts(dataset_registry.get('query_db'), column, selected_category)
+    return job_title_counts(dataset_registry.view('listings'), column, selected_category)
+
+
 @app.callback(
     Output('job-title-level-bar-chart', 'figure'),
     [Input('job-title-category-level-dropdown', 'value')]
 )
+@figure_cache.memoize(depends=job_title_depends)
 def update_job_title_level_bar_chart(selected_category):
-    return create_job_title_bar_chart(df, 'des_category_level', selected_category, des_categories_by_level)
+    return create_job_title_bar_chart(count_job_titles('des_category_level', selected_category), selected_category)
 
 
 @app.callback(
     Output('job-title-domain-bar-chart', 'figure'),
     [Input('job-title-category-domain-dropdown', 'value')]
 )
+@figure_cache.memoize(depends=job_title_depends)
 def update_job_title_domain_bar_chart(selected_category):
-    return create_job_title_bar_chart(df, 'des_category_domain', selected_category, des_categories_by_domain)
+    return create_job_title_bar_chart(count_job_titles('des_category_domain', selected_category), selected_category)
 
 
 @app.callback(
@@ -105,48 +192,26 @@ def update_job_title_domain_bar_chart(selected_category):
     [Input('level-dropdown', 'value'),
      Input('domain-dropdown', 'value')]
 )
+@figure_cache.memoize(depends=histogram_depends)
 def update_histogram(selected_level, selected_domain):
-    # Start with the default dataset
-    filtered_df = df_processed
     title = "Salary Distribution"  # Default title
 
-    # Filter the data and update the title based on user selection
+    # Update the title based on user selection
     if selected_level:
-        filtered_df = filtered_df[filtered_df['des_category_level'] == selected_level]
         title = f"Salary Distribution for {selected_level}"
     if selected_domain:
-        filtered_df = filtered_df[filtered_df['des_category_domain'] == selected_domain]
         title = f"Salary Distribution for {selected_domain}"
 
     # If both are selected, concatenate their titles
     if selected_level and selected_domain:
         title = f"Salary Distribution for {selected_level} in {selected_domain} Domain"
 
-        # Create the histogram based on the filtered data
-    fig = px.histogram(
-        filtered_df,
-        x="avg_salary",
-        title=title,
-        labels={"avg_salary": "Average Salary"},
-        color_discrete_sequence=["#00CC96"],  # Change this to your desired color
-    )
-
-    # Update layout to match the dark theme
-    fig.update_layout(
-        paper_bgcolor="#282c31",
-        plot_bgcolor="#282c31",
-        font=dict(color="#e9ecef"),
-        xaxis=dict(
-            gridcolor="#4f545a",  # Lighter than the plot background, but darker than text
-            zerolinecolor="#4f545a"
-        ),
-        yaxis=dict(
-            gridcolor="#4f545a",
-            zerolinecolor="#4f545a"
-        ),
-    )
-    fig.update_traces(opacity=0.8)
-    return fig
+    if query_backend.ENABLED:
+        bin_counts = query_backend.salary_histogram(dataset_registry.get('query_db'), selected_level, selected_domain)
+    else:
+        # Sum the pre-aggregated (level, domain, bin) counts instead of filtering every listing
+        bin_counts = query_salary_cube(dataset_registry.get('salary_cube'), selected_level, selected_domain)
+    return create_salary_histogram(bin_counts, title)
 
 
 @app.callback(
@@ -155,7 +220,7 @@ def update_histogram(selected_level, selected_domain):
 )
 def update_hard_skill_domain_table(selected_domain):
     if selected_domain:
-        return hard_skill_domain_tables[selected_domain]
+        return dataset_registry.get('skill_tables')['hard_domain'][selected_domain]
     return dash.no_update
 
 
@@ -165,7 +230,7 @@ def update_hard_skill_domain_table(selected_domain):
 )
 def update_hard_skill_level_table(selected_level):
     if selected_level:
-        return hard_skill_level_tables[selected_level]
+        return dataset_registry.get('skill_tables')['hard_level'][selected_level]
     return dash.no_update
 
 
@@ -175,7 +240,7 @@ def update_hard_skill_level_table(selected_level):
 )
 def update_soft_skill_domain_table(selected_domain):
     if selected_domain:
-        return soft_skill_domain_tables[selected_domain]
+        return dataset_registry.get('skill_tables')['soft_domain'][selected_domain]
     return dash.no_update
 
 
@@ -185,7 +250,7 @@ def update_soft_skill_domain_table(selected_domain):
 )
 def update_soft_skill_level_table(selected_level):
     if selected_level:
-        return soft_skill_level_tables[selected_level]
+        return dataset_registry.get('skill_tables')['soft_level'][selected_level]
     return dash.no_update
 
 
@@ -213,7 +278,7 @@ def reset_dropdowns(level_value, domain_value):
 
 
 @app.callback(
-    Output('search-results-content', 'children'),
+    Output('search-results-store', 'data'),
     [Input('search-button', 'n_clicks')],
     [State('job-search-dropdown', 'value'),
      State('location-search-dropdown', 'value')]
@@ -223,23 +288,59 @@ def update_search_results(n_clicks, selected_job, selected_location):
         raise PreventUpdate
 
     if not selected_job or not selected_location:
-        return dbc.Alert("Please select both a job and a location before searching.", color="danger")
+        return {'error': "Please select both a job and a location before searching."}
+
+    # Only the query and its match count go to the browser; pages are looked up in the index on demand
+    if query_backend.ENABLED:
+        total = query_backend.search_count(dataset_registry.get('query_db'), selected_job, selected_location)
+    else:
+        total = len(search_listings(dataset_registry.get('search_index'), selected_job, selected_location))
+    return {'job': selected_job, 'location': selected_location, 'total': total}
+
+
+def search_results_page(job, location, page_number):
+    # (title, salary, hard_skills, soft_skills) of one page of matches, and the total number of matches
+    if query_backend.ENABLED:
+        return query_backend.search_page(dataset_registry.get('query_db'), job, location, page_number,
+                                         SEARCH_PAGE_SIZE)
+
+    page_ids, total = search_page(dataset_registry.get('search_index'), job, location, page_number, SEARCH_PAGE_SIZE)
+    page = dataset_registry.view('listings').iloc[page_ids]
+    skills = dataset_registry.get('skills')
+    return page[['title', 'salary']].assign(hard_skills=skills_for_rows(skills['hard'], page_ids),
+                                            soft_skills=skills_for_rows(skills['soft'], page_ids)), total
+
+
+@app.callback(
+    [Output('search-results-content', 'children'),
+     Output('search-pagination', 'max_value'),
+     Output('search-pagination', 'active_page')],
+    [Input('search-results-store', 'data'),
+     Input('search-pagination', 'active_page')]
+)
+@figure_cache.memoize(depends=search_depends)
+def render_search_page(search, active_page):
+    if not search:
+        raise PreventUpdate
 
-    filtered_df = df[
-        ((df['des_category_level'] == selected_job) | (df['des_category_domain'] == selected_job)) &
-        (df['location'] == selected_location)
-    ]
+    if 'error' in search:
+        return dbc.Alert(search['error'], color="danger"), 1, 1
 
-    if filtered_df.empty:
-        return dbc.Alert("No jobs found for the selected job and location.", color="warning")
+    page_number = active_page or 1
+    page, total = search_results_page(search['job'], search['location'], page_number)
+    page_count = max(1, -(-total // SEARCH_PAGE_SIZE))
+    if page_number > page_count:
+        # Past the end after a new search with fewer matches; start over at the first page, and move the pager there
+        page_number = 1
+        page, total = search_results_page(search['job'], search['location'], page_number)
 
-    results = []
-    for _, row in filtered_df.iterrows():
-        job_title = row['title']
-        salary = row['salary']
-        top10_hard_skills = parse_skills(row['Top 10 Hard Skills'])
-        top10_soft_skills = parse_skills(row['Top 10 Soft Skills'])
+    if total == 0:
+        return dbc.Alert("No jobs found for the selected job and location.", color="warning"), 1, 1
 
+    first = (page_number - 1) * SEARCH_PAGE_SIZE + 1
+    results = [html.P(f"Showing {first}-{first + len(page) - 1} of {total} jobs", className="card-text")]
+    for job_title, salary, top10_hard_skills, top10_soft_skills in zip(
+            page['title'], page['salary'], page['hard_skills'], page['soft_skills']):
         job_card = dbc.Card(
             [
                 dbc.CardHeader(html.H5(job_title, className="card-title", style={"font-weight": "bold"})),
@@ -265,7 +366,7 @@ def update_search_results(n_clicks, selected_job, selected_location):
 
         results.append(job_card)
 
-    return results
+    return results, page_count, page_number
 
 
 @app.callback(
@@ -282,38 +383,17 @@ def trigger_search(n, job, location):
 
 
 @app.callback(
-    [
-        Output('total-jobs', 'children'),
-        Output('pie-chart-hard-skills', 'figure'),
-        Output('pie-chart-soft-skills', 'figure'),
-        Output('bar-chart-salary-ranges', 'figure')  # 新增
-    ],
+    Output('total-jobs', 'children'),
     [Input('url', 'pathname')]
 )
 def update_homepage_contents(pathname):
     if pathname != '/':
         raise PreventUpdate
 
-    total_jobs = len(df)
-    # Update the color scheme of the pie charts to match the style
-    fig_hard_skills = px.pie(top_10_hard_skills, names='Skill', values='Count', title='Top 10 Hard Skills')
-    fig_hard_skills.update_traces(marker=dict(colors=['#636EFA', '#EF553B', '#00CC96', '#AB63FA']))  # 使用您的颜色列表
-
-    fig_soft_skills = px.pie(top_10_soft_skills, names='Skill', values='Count', title='Top 10 Soft Skills')
-    fig_soft_skills.update_traces(marker=dict(colors=['#19D3F3', '#FF6692', '#B6E880', '#FF97FF']))  # 使用您的颜色列表
-
-    fig_salary_ranges = create_salary_bar_chart(df)
-
-    fig_hard_skills.update_layout(
-        paper_bgcolor="#282c31",
-        font=dict(color="#e9ecef")
-    )
-    fig_soft_skills.update_layout(
-        paper_bgcolor="#282c31",
-        font=dict(color="#e9ecef")
-    )
-
-    return total_jobs, fig_hard_skills, fig_soft_skills, fig_salary_ranges
+    # The home page figures are static graphs, loaded in the browser
+    if query_backend.ENABLED:
+        return query_backend.listing_count(dataset_registry.get('query_db'))
+    return len(dataset_registry.get('listings'))
 
 
 @app.callback(Output('page-content', 'children'),
@@ -352,13 +432,18 @@ def display_page(pathname):
         ])
     elif pathname == "/platform-distributions":
         return html.Div([
-            dcc.Graph(figure=fig_platform),
+            dcc.Graph(id='platform-graph'),
         ])
     elif pathname == "/usa-map":  # Handling the new route
         return html.Div([
-            dcc.Graph(figure=choropleth_map)
+            dcc.Graph(id='usa-map-graph')
         ])
     elif pathname == "/skills-insights":
+        skill_tables = dataset_registry.get('skill_tables')
+        hard_skill_domain_tables = skill_tables['hard_domain']
+        hard_skill_level_tables = skill_tables['hard_level']
+        soft_skill_domain_tables = skill_tables['soft_domain']
+        soft_skill_level_tables = skill_tables['soft_level']
         return dcc.Tabs(id='skills-tabs', children=[
             dcc.Tab(label='Hard Skills by Domain', children=[
                 dcc.Dropdown(
@@ -399,7 +484,9 @@ def display_page(pathname):
         ])
     elif pathname == "/search-results":
         return html.Div([
-            html.Div(id='search-results-content')  # Placeholder for search results
+            html.Div(id='search-results-content'),  # Placeholder for search results
+            dbc.Pagination(id='search-pagination', max_value=1, active_page=1, fully_expanded=False,
+                           previous_next=True, first_last=True),
         ])
     else:
         return html.Div(style={'display': 'flex', 'flex-wrap': 'wrap', 'height': '100vh', 'overflow': 'hidden'},
@@ -432,8 +519,42 @@ def display_page(pathname):
                         ])
 
 
-# Set the layout of the app
-app.layout = get_layout()
+@app.server.route('/cache-stats')
+def cache_stats():
+    return flask.jsonify(figure_cache.stats())
+
+
+# Yearly salary percentiles per job level, job domain and state, for internal tools; ?by= selects groupings.
+# Computed once per dataset version from the salary counts, which ingest() merges as listings arrive.
+@app.server.route('/api/salary-stats')
+def salary_stats():
+    stats = dataset_registry.get('salary_stats')
+    groupings = flask.request.args.getlist('by') or list(stats)
+    unknown = [by for by in groupings if by not in stats]
+    if unknown:
+        return flask.jsonify({'error': f"Unknown grouping: {', '.join(unknown)}", 'groupings': list(stats)}), 400
+
+    response = flask.jsonify({
+        'version': dataset_registry.version(),
+        'percentiles': [round(q * 100) for q in SALARY_PERCENTILES],
+        **{by: stats[by].to_dict(orient='index') for by in groupings},
+    })
+    # Clients revalidate on every request; an unchanged dataset version is answered with 304 Not Modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    return response.make_conditional(flask.request)
+
+
+# Per-callback latency, phase split and payload size on /metrics; DASHBOARD_LOG_CALLBACKS=1 also prints each request
+metrics.instrument(app, cache_stats=figure_cache.stats)
+
+
+def serve_layout():
+    return get_layout(figure_assets.urls(app, static_figures, figure_dependencies))
+
+
+# Set the layout of the app; built per page load, so the dropdowns and figure URLs follow the live dataset version
+app.layout = serve_layout
 
 # Run the app
 if __name__ == '__main__':
@@ -0,0 +1,21 @@
+// Loads a figure exported by figure_assets.py from its content-hashed file, which the browser keeps in its HTTP
+// cache. The page layout carries the URLs of the figures exported already, so a view costs no request to the
+// server; a figure missing there is looked up in the manifest, which exports just that figure on first request.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    figures: {
+        load: function (urls, manifestUrl, name) {
+            var url = urls && urls[name] ? Promise.resolve(urls[name]) :
+                fetch(manifestUrl + '?name=' + encodeURIComponent(name))
+                    .then(function (response) { return response.json(); })
+                    .then(function (manifest) { return manifest[name]; });
+            return url
+                .then(function (figureUrl) { return fetch(figureUrl); })
+                .then(function (response) {
+                    if (!response.ok) {
+                        throw new Error('Figure ' + name + ' could not be loaded: ' + response.status);
+                    }
+                    return response.json();
+                });
+        }
+    }
+});
@@ -0,0 +1,186 @@
+import argparse
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from synthetic import REPO_DIR, SIZES, generate_listings, parse_size
+
+import dataset_registry
+import figure_cache
+import startup
+from data_processing import (build_location_aggregates, build_skill_rankings, classify_listings, compact_listings,
+                             des_categories_by_domain, des_categories_by_level, job_title_counts,
+                             map_salary_to_range, normalize_skills, parse_salaries, parse_skills,
+                             process_data_optimized)
+from visualizations import create_job_title_bar_chart, create_skill_table, generate_choropleth_map
+
+# Hot-path benchmark on synthetic listings (see synthetic.py): data_processing steps, figure builders and every
+# Dash callback that touches the data, called directly. Each case reports the min and median wall time over
+# --repeat runs and the peak traced memory (tracemalloc) of one extra run. Callbacks are timed cold: the figure
+# and callback caches are cleared before every run.
+# Run from the repository root: python benchmarks/bench_hot_paths.py --sizes 10k 100k --output hot_paths.json
+DEFAULT_SIZES = ['10k', '100k', '1M']
+LEVEL = list(des_categories_by_level)[0]
+DOMAIN = list(des_categories_by_domain)[0]
+PAGES = ['/', '/job-title-distributions', '/salary-distributions', '/platform-distributions', '/usa-map',
+         '/skills-insights', '/search-results']
+
+
+def measure(func, repeat, setup=None):
+    times = []
+    # Progress and memory prints from the pipeline would drown the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'min_s': min(times), 'median_s': statistics.median(times), 'peak_mib': peak / 1024 ** 2}
+
+
+def pipeline_cases(raw):
+    # Inputs are built once up front, so each case only times its own step
+    with contextlib.redirect_stdout(io.StringIO()):
+        listings = parse_salaries(compact_listings(classify_listings(raw)))
+        skills, _ = normalize_skills(listings)
+        skill_rankings = build_skill_rankings(listings, skills)
+        state_aggregates = build_location_aggregates(listings)
+    with_salary = listings[listings['salary'] != 'Not specified']
+    level_counts = job_title_counts(listings, 'des_category_level', None)
+    title_counts = job_title_counts(listings, 'des_category_level', LEVEL)
+
+    return {
+        'classify_listings': lambda: classify_listings(raw),
+        'compact_listings': lambda: compact_listings(raw),
+        'parse_salaries': lambda: parse_salaries(listings),
+        'map_salary_to_range': lambda: raw['salary'].map(map_salary_to_range),
+        'process_data_optimized': lambda: process_data_optimized(with_salary),
+        'parse_skills': lambda: raw['Top 10 Hard Skills'].map(parse_skills),
+        'normalize_skills': lambda: normalize_skills(listings),
+        'build_skill_rankings': lambda: build_skill_rankings(listings, skills),
+        'build_location_aggregates': lambda: build_location_aggregates(listings),
+        'job_title_counts(level)': lambda: job_title_counts(listings, 'des_category_level', None),
+        'job_title_counts(level, selected)': lambda: job_title_counts(listings, 'des_category_level', LEVEL),
+        'create_job_title_bar_chart(level)': lambda: create_job_title_bar_chart(level_counts, None),
+        'create_job_title_bar_chart(level, selected)': lambda: create_job_title_bar_chart(title_counts, LEVEL),
+        'generate_choropleth_map': lambda: generate_choropleth_map(state_aggregates),
+        'create_skill_table': lambda: create_skill_table(
+            skill_rankings['top_hard_skills_by_domain'], "Hard Skill", "Domain"),
+    }
+
+
+def callback_cases(app):
+    def search_page():
+        search = app.update_search_results(1, DOMAIN, 'Anywhere')
+        return app.render_search_page(search, 1)
+
+    cases = {
+        'update_job_title_level_bar_chart(None)': lambda: app.update_job_title_level_bar_chart(None),
+        f'update_job_title_level_bar_chart({LEVEL})': lambda: app.update_job_title_level_bar_chart(LEVEL),
+        'update_job_title_domain_bar_chart(None)': lambda: app.update_job_title_domain_bar_chart(None),
+        f'update_job_title_domain_bar_chart({DOMAIN})': lambda: app.update_job_title_domain_bar_chart(DOMAIN),
+        'update_histogram(None, None)': lambda: app.update_histogram(None, None),
+        f'update_histogram({LEVEL}, {DOMAIN})': lambda: app.update_histogram(LEVEL, DOMAIN),
+        'update_hard_skill_domain_table': lambda: app.update_hard_skill_domain_table(DOMAIN),
+        'update_hard_skill_level_table': lambda: app.update_hard_skill_level_table(LEVEL),
+        'update_soft_skill_domain_table': lambda: app.update_soft_skill_domain_table(DOMAIN),
+        'update_soft_skill_level_table': lambda: app.update_soft_skill_level_table(LEVEL),
+        'update_search_results': lambda: app.update_search_results(1, DOMAIN, 'Anywhere'),
+        'update_search_results + render_search_page': search_page,
+        'update_homepage_contents': lambda: app.update_homepage_contents('/'),
+    }
+    for page in PAGES:
+        cases[f'display_page({page})'] = lambda page=page: app.display_page(page)
+    return cases
+
+
+def use_listings(raw):
+    # The registry loads the synthetic frame instead of fetching the dataset; without a snapshot hash the
+    # dataset version is process-local, so nothing is written to the callback disk cache
+    dataset_registry.load_data = lambda refresh=False: raw
+    dataset_registry.snapshot_version = lambda: None
+    dataset_registry.clear()
+    figure_cache.clear()
+
+
+def run_size(label, n_rows, repeat, seed):
+    start = time.perf_counter()
+    raw = generate_listings(n_rows, seed)
+    results = {'generate': {'min_s': time.perf_counter() - start}}
+
+    for name, func in pipeline_cases(raw).items():
+        results[name] = measure(func, repeat)
+        print(f"{label:>5} {name:<60} {results[name]['min_s']:9.4f}s {results[name]['peak_mib']:9.1f} MiB")
+
+    use_listings(raw)
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = importlib.import_module('app')
+    results['startup'] = measure(lambda: startup.run(app.startup_stages), repeat,
+                                 setup=lambda: (dataset_registry.clear(), figure_cache.clear()))
+    with contextlib.redirect_stdout(io.StringIO()):
+        startup.run(app.startup_stages)
+    for name, func in callback_cases(app).items():
+        results[name] = measure(func, repeat, setup=figure_cache.clear)
+    for name in ['startup', *callback_cases(app)]:
+        print(f"{label:>5} {name:<60} {results[name]['min_s']:9.4f}s {results[name]['peak_mib']:9.1f} MiB")
+
+    results['max_rss_mib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time data processing, figure builders and callbacks")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help=f"Row counts or any of {', '.join(SIZES)}; 10M needs well over 10 GB of memory")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    report = {
+        'commit': _commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': {},
+    }
+    for size in args.sizes:
+        report['results'][size] = run_size(size, parse_size(size), args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
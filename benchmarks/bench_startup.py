@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Startup benchmark: import time of app.py (python -X importtime) and time from process start until the
+# server answers its first request, in eager and lazy (DASHBOARD_DEFER_STARTUP=1) mode.
+# Run from the repository root: python benchmarks/bench_startup.py --output startup.json
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {'eager': '0', 'lazy': '1'}
+
+
+def _env(defer):
+    return {**os.environ, 'DASHBOARD_DEFER_STARTUP': defer}
+
+
+def measure_importtime(defer, top_n=15):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=REPO_DIR, env=_env(defer), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append({'module': name, 'self_s': int(self_us) / 1e6, 'cumulative_s': int(cumulative_us) / 1e6})
+
+    app_entry = next(module for module in modules if module['module'] == 'app')
+    return {
+        'app_import_s': app_entry['cumulative_s'],
+        'slowest_modules': sorted(modules, key=lambda module: -module['self_s'])[:top_n],
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_response(defer, path='/', timeout=120):
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-c', f"from app import app; app.server.run(host='127.0.0.1', port={port})"],
+        cwd=REPO_DIR, env=_env(defer), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as response:
+                    response.read()
+                return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise TimeoutError(f"No response from the server within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure app import time and time to first response")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for mode, defer in MODES.items():
+        imports = [measure_importtime(defer) for _ in range(args.repeat)]
+        first_responses = [measure_first_response(defer) for _ in range(args.repeat)]
+        results[mode] = {
+            'app_import_s': min(run['app_import_s'] for run in imports),
+            'first_response_s': min(first_responses),
+            'slowest_modules': min(imports, key=lambda run: run['app_import_s'])['slowest_modules'],
+        }
+        print(f"{mode:<6} import {results[mode]['app_import_s']:.2f}s, "
+              f"first response {results[mode]['first_response_s']:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
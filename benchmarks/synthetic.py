@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from data_processing import des_categories_by_domain, des_categories_by_level  # noqa: E402
+
+# Synthetic job listings in the schema of the scraped CSV: category columns are left out, so they are derived
+# from the titles at load time just like for the real data. The same seed and size always give the same frame.
+# Write one to CSV with: python benchmarks/synthetic.py 100000 listings.csv
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+LOCATIONS = ['Anywhere', 'United States', 'New York, NY', 'San Francisco, CA', 'Austin, TX', 'Chicago, IL',
+             'Seattle, WA', 'Boston, MA', 'Atlanta, GA', 'Denver, CO', 'Kansas City, MO', 'Miami, FL',
+             'Washington, DC', 'Phoenix, AZ', 'Columbus, OH', 'Raleigh, NC', 'Salt Lake City, UT', 'Remote']
+PLATFORMS = ['LinkedIn', 'Indeed', 'Upwork', 'ZipRecruiter', 'BeBee', 'Glassdoor', 'Monster', 'Dice', 'Jooble',
+             'Built In', 'Snagajob', 'Adzuna']
+HARD_SKILLS = ['SQL (Programming Language)', 'Python (Programming Language)',
+               'Tableau (Business Intelligence Software)', 'Data Visualization', 'R (Programming Language)',
+               'Power BI', 'Business Intelligence', 'Quantitative Data Analysis', 'Ad Hoc Testing', 'Data Modeling',
+               'Microsoft Excel', 'Statistics', 'Looker (Software)', 'Snowflake', 'ETL']
+SOFT_SKILLS = ['Positivity', 'Communications', 'Collaboration', 'Presentations', 'Planning', 'Decisiveness',
+               'Innovation', 'Verbal Communication Skills', 'Problem Solving', 'Research', 'Leadership',
+               'Curiosity']
+
+
+def _salary_pool(rng, size):
+    # Every salary format seen in the scraped data, plus 'Not specified', which covers a large share of listings
+    low = rng.integers(30, 200, size) * 1000
+    high = low + rng.integers(5, 60, size) * 1000
+    hourly = rng.integers(15, 90, size)
+    formats = [
+        lambda i: f"{low[i]:,}-{high[i]:,} a year",
+        lambda i: f"${low[i]:,} - ${high[i]:,} a year",
+        lambda i: f"{low[i]:,} a year",
+        lambda i: f"${low[i]:,}.00 per year",
+        lambda i: f"{hourly[i]}-{hourly[i] + 15} an hour",
+        lambda i: f"${hourly[i]}.50 an hour",
+        lambda i: f"{low[i] // 12:,} a month",
+        lambda i: f"{low[i] // 52:,}-{high[i] // 52:,} a week",
+        lambda i: f"{hourly[i] * 8} a day",
+        lambda i: f"Up to ${high[i]:,} a year",
+        lambda i: f"From ${low[i]:,} a year",
+        lambda i: f"From ${hourly[i]} an hour",
+        lambda i: "Competitive",
+    ]
+    pool = list(dict.fromkeys(formats[i % len(formats)](i) for i in range(size)))
+    return ['Not specified'] + pool
+
+
+def _title_pool(rng, size):
+    levels = [''] + [keyword.title() for keywords in des_categories_by_level.values() for keyword in keywords]
+    domains = [''] + [keyword.title() for keywords in des_categories_by_domain.values() for keyword in keywords]
+    roles = ['Data Analyst', 'Analyst', 'Data Specialist', 'Reporting Analyst', 'Insights Analyst']
+    suffixes = ['', ' - Remote', ' (Contract)', ' II', ', Hybrid']
+    titles = (np.array(levels, dtype=object)[rng.integers(0, len(levels), size)] + ' '
+              + np.array(domains, dtype=object)[rng.integers(0, len(domains), size)] + ' '
+              + np.array(roles, dtype=object)[rng.integers(0, len(roles), size)]
+              + np.array(suffixes, dtype=object)[rng.integers(0, len(suffixes), size)])
+    return list(dict.fromkeys(' '.join(title.split()) for title in titles))
+
+
+def _skill_pool(rng, skills, size, per_listing):
+    pool = [str([skills[i] for i in rng.choice(len(skills), per_listing, replace=False)]) for _ in range(size)]
+    # A few empty and malformed values, as in the scraped data
+    return list(dict.fromkeys(pool)) + ['', '[]', "['SQL (Programming Language)'"]
+
+
+def _sample(rng, pool, n_rows, not_specified_share=None):
+    pool = np.array(pool, dtype=object)
+    if not_specified_share is None:
+        return pool[rng.integers(0, len(pool), n_rows)]
+    # The first pool entry is drawn with the given share, the rest uniformly
+    codes = rng.integers(1, len(pool), n_rows)
+    codes[rng.random(n_rows) < not_specified_share] = 0
+    return pool[codes]
+
+
+def generate_listings(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    # Distinct values grow with the row count but stay far below it, like the real data
+    distinct = int(min(max(n_rows // 20, 200), 200_000))
+    return pd.DataFrame({
+        'title': _sample(rng, _title_pool(rng, distinct), n_rows),
+        'location': _sample(rng, LOCATIONS, n_rows),
+        'platform': _sample(rng, PLATFORMS, n_rows),
+        'salary': _sample(rng, _salary_pool(rng, distinct), n_rows, not_specified_share=0.45),
+        'Top 10 Hard Skills': _sample(rng, _skill_pool(rng, HARD_SKILLS, distinct, 5), n_rows),
+        'Top 10 Soft Skills': _sample(rng, _skill_pool(rng, SOFT_SKILLS, distinct, 4), n_rows),
+        'job_id': np.char.add('job-', np.arange(n_rows).astype(str)).astype(object),
+    })
+
+
+def parse_size(value):
+    return SIZES[value] if value in SIZES else int(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic listings CSV")
+    parser.add_argument('rows', type=parse_size, help=f"Row count or one of {', '.join(SIZES)}")
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_listings(args.rows, args.seed).to_csv(args.output, index=False)
@@ -1,11 +1,44 @@
+import argparse
 import ast
+import bisect
+import glob
+import hashlib
+import io
+import json
+import os
 import re
+import shutil
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
+from metrics import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Without pyarrow no snapshot is kept and every load fetches the CSV
+    pa = feather = None
+
 # Load the dataset
 url = "https://raw.githubusercontent.com/lit42/test/main/1.9.4_dataset.csv"
 
+# Local columnar snapshot of the dataset (uncompressed Feather, quick to read back). The content hash of the
+# source is stored in the file's schema, so the data and its version are always read together.
+SNAPSHOT_DIR = os.environ.get('DASHBOARD_SNAPSHOT_DIR', 'data_cache')
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, 'listings.feather')
+SNAPSHOT_META_PATH = os.path.join(SNAPSHOT_DIR, 'listings.json')
+# Prepared frames published for worker processes to memory-map, see publish_frames
+SHARED_DIR = os.path.join(SNAPSHOT_DIR, 'shared')
+# Cache files of other dataset versions are only removed once no process has touched them for this long, so a
+# worker still serving an older version keeps its files (see touch and remove_stale)
+STALE_AFTER = float(os.environ.get('DASHBOARD_STALE_AFTER', 24 * 3600))
+FETCH_TIMEOUT = 30
+
 des_categories_by_level = {
     "Junior Data Analysts": ["junior", "jr", "entry level", "entry-level", "analyst i", "analyst 1", "intern"],
     "Senior Data Analysts": ["senior", "sr", "analyst ii", "analyst 2", "analyst iii", "analyst 3", "advanced"],
@@ -33,78 +66,865 @@ des_categories_by_domain = {
 }
 
 
-# Load the dataset
-def load_data():
+# Keyword map for each category column the dashboard filters on
+CATEGORY_COLUMNS = {
+    'des_category_level': des_categories_by_level,
+    'des_category_domain': des_categories_by_domain,
+}
+
+
+def compile_category_pattern(categories):
+    # One alternation with a named group per category, so a single regex pass finds the matching category.
+    # The leftmost keyword in the title wins; at the same position the category listed first wins.
+    groups = []
+    for i, keywords in enumerate(categories.values()):
+        keywords = sorted(keywords, key=len, reverse=True)
+        groups.append(f"(?P<c{i}>{'|'.join(re.escape(keyword) for keyword in keywords)})")
+    return re.compile(r'\b(?:' + '|'.join(groups) + r')\b', re.IGNORECASE)
+
+
+def classify_titles(titles, categories, default=None):
+    pattern = compile_category_pattern(categories)
+    # Titles repeat heavily, so only the distinct ones go through the regex
+    codes, uniques = pd.factorize(titles)
+    matches = pd.Series(uniques, dtype=object).str.extract(pattern).notna().to_numpy()
+
+    names = np.array(list(categories), dtype=object)
+    labels = np.where(matches.any(axis=1), names[matches.argmax(axis=1)], default)
+    # Missing titles have code -1, which picks up the default appended here
+    labels = np.append(labels, default)
+    return pd.Series(labels[codes], index=titles.index, dtype=object)
+
+
+def classify_listings(df):
+    # Scraped listings arrive without the category columns; fill in any that are absent from the titles
+    missing = {column: classify_titles(df['title'], categories)
+               for column, categories in CATEGORY_COLUMNS.items() if column not in df}
+    return df.assign(**missing) if missing else df
+
+
+# Columns the dashboard reads; everything else is dropped at load time
+LISTING_COLUMNS = [
+    'title', 'location', 'platform', 'salary', 'des_category_level', 'des_category_domain',
+    'Top 10 Hard Skills', 'Top 10 Soft Skills',
+]
+# Columns with at most this share of distinct values are stored as category, the rest as strings
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+STRING_DTYPE = 'string[pyarrow]' if feather is not None else object
+
+
+def compact_listings(df, columns=LISTING_COLUMNS, max_unique_ratio=CATEGORY_MAX_UNIQUE_RATIO):
+    # Low-cardinality text becomes category, so filters compare integer codes instead of Python strings
+    before = df.memory_usage(deep=True).sum()
+    df = df[[column for column in columns if column in df]]
+    dtypes = {}
+    for column in df.columns:
+        if df[column].nunique() <= max_unique_ratio * len(df):
+            dtypes[column] = 'category'
+        else:
+            dtypes[column] = STRING_DTYPE
+    df = df.astype(dtypes)
+    after = df.memory_usage(deep=True).sum()
+    print(f"Listings memory: {before / 1024 ** 2:.1f} MiB -> {after / 1024 ** 2:.1f} MiB")
+    return df
+
+
+def prepare_listings(raw):
+    # Raw listings (full dataset or a delta batch) in the shape the dashboard reads
+    return parse_salaries(compact_listings(classify_listings(raw)))
+
+
+def listing_keys(raw):
+    # One uint64 per listing: a hash of job_id when the source has one, otherwise of the listing itself
+    if 'job_id' in raw:
+        keys = pd.util.hash_pandas_object(raw['job_id'].astype(str), index=False)
+    else:
+        keys = pd.util.hash_pandas_object(raw[[column for column in LISTING_COLUMNS if column in raw]], index=False)
+    return keys.to_numpy()
+
+
+def _append_column(column, values):
+    # Categorical columns take the batch's new values as extra categories, which leaves existing codes valid
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        new_values = pd.Index(pd.unique(values.dropna().astype(object)), dtype=object)
+        new_values = new_values.difference(column.cat.categories.astype(object), sort=False)
+        if len(new_values):
+            column = column.cat.add_categories(new_values)
+    return pd.concat([column, values.astype(column.dtype)], ignore_index=True)
+
+
+def append_listings(df, batch):
+    # Rows of batch appended after df, in the dtypes of df; neither frame is modified
+    batch = batch.reindex(columns=df.columns)
+    return pd.DataFrame({column: _append_column(df[column], batch[column]) for column in df.columns})
+
+
+def read_snapshot_meta():
+    try:
+        with open(SNAPSHOT_META_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot_meta(meta):
+    tmp_path = f"{SNAPSHOT_META_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, SNAPSHOT_META_PATH)
+
+
+def read_snapshot():
+    if feather is None or not os.path.exists(SNAPSHOT_PATH):
+        return None
+    try:
+        table = feather.read_table(SNAPSHOT_PATH)
+    except Exception as e:
+        print(f"Error reading snapshot {SNAPSHOT_PATH}: {e}")
+        return None
+    df = table.to_pandas()
+    df.attrs['snapshot_version'] = _schema_version(table.schema)
+    return df
+
+
+def write_snapshot(df, meta):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Write under a name of this process's own next to the live snapshot and swap it in, so neither a crash nor
+    # another worker writing the same snapshot ever leaves a half-written file behind
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'sha256': meta['sha256'].encode()})
+    tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, SNAPSHOT_PATH)
+    _write_snapshot_meta(meta)
+
+
+def refresh_snapshot(read=True):
+    # Conditional GET against the source; only re-parse and re-write when the content actually changed.
+    # With read=False an unchanged snapshot isn't read back, and None is returned instead of it.
+    meta = read_snapshot_meta() if os.path.exists(SNAPSHOT_PATH) else None
+    request = urllib.request.Request(url)
+    if meta and meta.get('etag'):
+        request.add_header('If-None-Match', meta['etag'])
+    if meta and meta.get('last_modified'):
+        request.add_header('If-Modified-Since', meta['last_modified'])
+
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            raw = response.read()
+            headers = response.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and meta:
+            meta['checked_at'] = time.time()
+            if snapshot_version() is None and meta.get('sha256'):
+                # Snapshots written before the hash was stored in the file itself are tagged once
+                df = read_snapshot()
+                if df is not None:
+                    write_snapshot(df, meta)
+                    df.attrs['snapshot_version'] = meta['sha256']
+                    return df if read else None
+            _write_snapshot_meta(meta)
+            return read_snapshot() if read else None
+        raise
+
+    content_hash = hashlib.sha256(raw).hexdigest()
+    new_meta = {
+        'source': url,
+        'sha256': content_hash,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'fetched_at': time.time(),
+        'checked_at': time.time(),
+    }
+    if meta and meta.get('sha256') == content_hash and snapshot_version() == content_hash:
+        df = read_snapshot() if read else None
+        if df is not None or not read:
+            _write_snapshot_meta({**meta, **new_meta})
+            return df
+
+    df = pd.read_csv(io.BytesIO(raw))
+    if feather is not None:
+        new_meta['rows'] = len(df)
+        write_snapshot(df, new_meta)
+        df.attrs['snapshot_version'] = content_hash
+    return df
+
+
+def publish_frames(frames, version, directory=SHARED_DIR):
+    # Writes each frame as an uncompressed Arrow IPC (Feather v2) file tagged with the dataset version, so other
+    # processes can memory-map it instead of building the frame themselves
+    if feather is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name, df in frames.items():
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'dataset_version': version.encode()})
+        path = os.path.join(directory, f'{name}.arrow')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+
+
+def attach_frames(names, version, directory=SHARED_DIR):
+    # Frames published for this dataset version, memory-mapped read-only; None unless all of them are there.
+    # Strings, numbers without missing values and skill rows are used in place from the mapped file; only
+    # category codes and columns with missing values are copied into this process.
+    if feather is None:
+        return None
+    frames = {}
+    for name in names:
+        try:
+            table = feather.read_table(os.path.join(directory, f'{name}.arrow'), memory_map=True)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        if (table.schema.metadata or {}).get(b'dataset_version') != version.encode():
+            return None
+        frames[name] = table.to_pandas(split_blocks=True)
+    return frames
+
+
+def touch(path):
+    # Marks a cache file or directory as in use by this process; False when it is gone
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def remove_stale(directory, keep=(), select=None, max_age=STALE_AFTER):
+    # Removes the entries of directory that select accepts (all by default), other than those in keep, that no
+    # process has touched for max_age seconds. Cleanup is best effort and never raises.
+    now = time.time()
+    try:
+        entries = os.listdir(directory)
+    except OSError:
+        return
+    for entry in entries:
+        if entry in keep or (select is not None and not select(entry)):
+            continue
+        path = os.path.join(directory, entry)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _schema_version(schema):
+    return (schema.metadata or {}).get(b'sha256', b'').decode() or None
+
+
+def snapshot_version():
+    # Content hash of the snapshot on disk, read from the snapshot file itself; frames returned by load_data carry
+    # the hash of the data they hold as df.attrs['snapshot_version']
+    if feather is None:
+        return None
+    try:
+        with pa.memory_map(SNAPSHOT_PATH) as source:
+            return _schema_version(pa.ipc.open_file(source).schema)
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+# Load the dataset, preferring the local snapshot over a network fetch
+def load_data(refresh=False):
+    if not refresh:
+        df = read_snapshot()
+        if df is not None:
+            return df
     try:
-        df = pd.read_csv(url)
+        df = refresh_snapshot()
     except Exception as e:
         print(f"Error loading dataset: {e}")
-        df = None  # Set df to None to indicate an issue
+        df = read_snapshot()  # Fall back to the last good snapshot when offline, None if there is none
     return df
 
 
-def load_skill_dataset(filepath):
-    return pd.read_csv(filepath)
+# Salary strings look like "50,000-70,000 a year", "80,000 a year", "25-30 an hour" or "Not specified", with an
+# optional text prefix as in "Up to $80,000 a year" or "From $50,000 a year"
+SALARY_PATTERN = re.compile(
+    r'^\D*?(?P<low>\d[\d,]*(?:\.\d+)?)'
+    r'(?:\s*-\s*\$?(?P<high>\d[\d,]*(?:\.\d+)?))?'
+    r'(?:\s*(?:an?|per)\s+(?P<period>year|month|week|day|hour))?',
+    re.IGNORECASE
+)
 
+# Yearly salary buckets: left-closed bins and their labels
+SALARY_BINS = [float('-inf'), 50000, 75000, 100000, 125000, 150000, 175000, 200000, float('inf')]
+SALARY_LABELS = ["<50k", "50k-75k", "75k-100k", "100k-125k", "125k-150k", "150k-175k", "175k-200k", "200k+"]
 
-# Data processing function
-def process_data_optimized(df):
-    # Split salaries on "-"
-    split_salaries = df['salary'].str.split('-', expand=True)
 
-    # Clean and convert to float
-    df.loc[:, 'lower_bound'] = split_salaries[0].str.replace("[^0-9]", "", regex=True).astype(float)
-    df.loc[:, 'upper_bound'] = split_salaries[1].str.replace("[^0-9]", "", regex=True).astype(float)
+def parse_salaries(df, bins=SALARY_BINS, labels=SALARY_LABELS):
+    # Salary strings repeat heavily, so parse each distinct string once and broadcast back by code
+    codes, uniques = pd.factorize(df['salary'])
+    parts = pd.Series(uniques, dtype=object).str.extract(SALARY_PATTERN)
+
+    low = pd.to_numeric(parts['low'].str.replace(',', '', regex=False), errors='coerce')
+    high = pd.to_numeric(parts['high'].str.replace(',', '', regex=False), errors='coerce')
+    period = parts['period'].str.lower()
+    avg = (low + high.fillna(low)) / 2
 
-    # Compute average salary
-    df.loc[:, 'avg_salary'] = df[['lower_bound', 'upper_bound']].mean(axis=1)
+    salary_range = pd.cut(avg.where(period == 'year'), bins=bins, labels=labels, right=False)
+    salary_range = salary_range.cat.add_categories('Other')
+    specified = pd.Series(uniques != 'Not specified')
+    salary_range = salary_range.mask(specified & (period != 'year'), 'Other')
+
+    # Missing salaries have code -1, which picks up the all-NaN row appended here
+    parsed = pd.DataFrame({
+        'salary_low': low,
+        'salary_high': high,
+        'salary_period': period.astype('category'),
+        'salary_avg': avg,
+        'salary_range': salary_range,
+    })
+    parsed = parsed.reindex(range(len(parsed) + 1)).take(codes).set_index(df.index)
+    return df.assign(**parsed)
+
+
+def _add_salary_columns(df):
+    # Reuse the parsed salary columns when the frame already has them
+    if 'salary_avg' not in df:
+        df = parse_salaries(df)
+
+    return df.assign(
+        lower_bound=df['salary_low'],
+        upper_bound=df['salary_high'],
+        avg_salary=df['salary_avg'],
+    )
+
+
+def iqr_bounds(Q1, Q3):
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+# Data processing function
+def process_data_optimized(df):
+    df = _add_salary_columns(df)
 
     # Handle outliers
     Q1 = df['avg_salary'].quantile(0.25)
     Q3 = df['avg_salary'].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
+    lower_bound, upper_bound = iqr_bounds(Q1, Q3)
     df = df[(df['avg_salary'] >= lower_bound) & (df['avg_salary'] <= upper_bound)]
 
     return df
 
 
+def quantile_from_counts(value_counts, q):
+    # Same linear interpolation as Series.quantile, computed from a (value -> count) histogram
+    value_counts = value_counts.sort_index()
+    cumulative = value_counts.to_numpy().cumsum()
+    position = (cumulative[-1] - 1) * q
+    lower = value_counts.index[np.searchsorted(cumulative, np.floor(position), side='right')]
+    upper = value_counts.index[np.searchsorted(cumulative, np.ceil(position), side='right')]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+def _read_listing_chunks(filepath, chunksize):
+    for chunk in pd.read_csv(filepath, chunksize=chunksize):
+        yield _add_salary_columns(classify_listings(chunk))
+
+
+# Streaming counterpart of process_data_optimized for inputs that don't fit in memory.
+# Pass 1 builds an exact histogram of average salaries (values repeat heavily, so it stays small and merges
+# across chunks by addition); pass 2 re-reads the chunks, applies the IQR filter and writes one Parquet file
+# per chunk. Peak memory is one chunk plus the histogram.
+def process_data_streaming(filepath, output_dir, chunksize=200000):
+    salary_counts = pd.Series(dtype=np.int64)
+    for chunk in _read_listing_chunks(filepath, chunksize):
+        salary_counts = salary_counts.add(chunk['avg_salary'].value_counts(), fill_value=0)
+    if salary_counts.empty:
+        raise ValueError(f"No parsable salaries in {filepath}")
+
+    Q1 = quantile_from_counts(salary_counts, 0.25)
+    Q3 = quantile_from_counts(salary_counts, 0.75)
+    lower_bound, upper_bound = iqr_bounds(Q1, Q3)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for stale_part in glob.glob(os.path.join(output_dir, 'part-*.parquet')):
+        os.remove(stale_part)
+
+    rows_in = rows_out = partitions = 0
+    for chunk in _read_listing_chunks(filepath, chunksize):
+        rows_in += len(chunk)
+        chunk = chunk[(chunk['avg_salary'] >= lower_bound) & (chunk['avg_salary'] <= upper_bound)]
+        if chunk.empty:
+            continue
+        chunk.to_parquet(os.path.join(output_dir, f'part-{partitions:05d}.parquet'), index=False)
+        rows_out += len(chunk)
+        partitions += 1
+
+    summary = {
+        'source': filepath,
+        'lower_bound': float(lower_bound),
+        'upper_bound': float(upper_bound),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'partitions': partitions,
+    }
+    with open(os.path.join(output_dir, '_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+# Width of the salary bins used by the pre-aggregated histogram cube
+HISTOGRAM_BIN_WIDTH = 5000
+
+
+CUBE_COLUMNS = ['des_category_level', 'des_category_domain']
+# Stands in for a missing level or domain in the cube counts: with NaN in their index, merging a batch's counts
+# would have pandas order NaN against the category names, which it can't
+NO_CATEGORY = ''
+
+
+def count_salary_cube(df):
+    # Additive (level, domain, average salary) counts of the listings with a salary; the cube is built from these,
+    # so it follows ingested batches without going back to the listings
+    salary = df['salary_avg'].where(df['salary'] != 'Not specified')
+    has_salary = salary.notna()
+    columns = {column: df[column].astype(object)[has_salary].fillna(NO_CATEGORY) for column in CUBE_COLUMNS}
+    return pd.DataFrame({**columns, 'salary': salary[has_salary]}).groupby(CUBE_COLUMNS + ['salary']).size()
+
+
+def salary_bounds(salary_counts):
+    # IQR outlier bounds of process_data_optimized, from count_salary_cube output; None without salaries
+    histogram = salary_counts[salary_counts > 0].groupby(level='salary').sum()
+    if histogram.empty:
+        return None
+    return iqr_bounds(quantile_from_counts(histogram, 0.25), quantile_from_counts(histogram, 0.75))
+
+
+def salary_cube_from_counts(salary_counts, bin_width=HISTOGRAM_BIN_WIDTH):
+    # (level, domain, salary bin) -> listing count of process_data_optimized(...) output, from count_salary_cube
+    # output: the counts within the salary_bounds are summed per salary bin. Histogram filters then sum a few
+    # hundred rows instead of masking every listing
+    salary_counts = salary_counts[salary_counts > 0]
+    if salary_counts.empty:
+        return pd.DataFrame(columns=CUBE_COLUMNS + ['salary_bin', 'count'])
+    salaries = salary_counts.index.get_level_values('salary')
+    lower_bound, upper_bound = salary_bounds(salary_counts)
+
+    cube = salary_counts[(salaries >= lower_bound) & (salaries <= upper_bound)].rename('count').reset_index()
+    cube['salary_bin'] = (cube.pop('salary') // bin_width) * bin_width
+    cube = cube.groupby(CUBE_COLUMNS + ['salary_bin'])['count'].sum().reset_index()
+    cube[CUBE_COLUMNS] = cube[CUBE_COLUMNS].mask(cube[CUBE_COLUMNS] == NO_CATEGORY)
+    return cube
+
+
+@timed('pandas')
+def query_salary_cube(cube, level=None, domain=None):
+    if level:
+        cube = cube[cube['des_category_level'] == level]
+    if domain:
+        cube = cube[cube['des_category_domain'] == domain]
+    return cube.groupby('salary_bin')['count'].sum()
+
+
 def parse_skills(skills_str):
     try:
         skills = ast.literal_eval(skills_str)
         return ', '.join(skills)
-    except ValueError:
+    except (ValueError, SyntaxError):
         return skills_str
 
 
+# Raw columns holding Python-literal skill lists, keyed by skill kind
+SKILL_COLUMNS = {'hard': 'Top 10 Hard Skills', 'soft': 'Top 10 Soft Skills'}
+# Above this many distinct skill strings, literal evaluation is spread over worker processes
+PARALLEL_PARSE_THRESHOLD = 200000
+
+
+def _parse_skill_values(values):
+    # Returns one list per value, or None when the value isn't a list literal
+    parsed = []
+    for value in values:
+        try:
+            skills = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            skills = None
+        parsed.append([str(skill) for skill in skills] if isinstance(skills, (list, tuple)) else None)
+    return parsed
+
+
+def _parse_skill_uniques(uniques, workers=None):
+    if len(uniques) < PARALLEL_PARSE_THRESHOLD and not workers:
+        return _parse_skill_values(uniques)
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = -(-len(uniques) // workers)
+    chunks = [uniques[i:i + chunk_size] for i in range(0, len(uniques), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [skills for chunk in executor.map(_parse_skill_values, chunks) for skills in chunk]
+
+
+def normalize_skills(df, workers=None):
+    # Parse the skill list columns once into long tables of (row position, categorical skill), sorted by row.
+    # Values that aren't list literals are collected into a report instead of being passed through.
+    tables = {}
+    malformed = []
+    for kind, column in SKILL_COLUMNS.items():
+        codes, uniques = pd.factorize(df[column])
+        parsed = _parse_skill_uniques(list(uniques), workers)
+
+        bad_codes = [code for code, skills in enumerate(parsed) if skills is None]
+        for row in np.flatnonzero(np.isin(codes, bad_codes)):
+            malformed.append({'row': row, 'kind': kind, 'value': uniques[codes[row]]})
+
+        # Missing values (code -1) pick up the empty list appended at the end
+        parsed = [skills or [] for skills in parsed] + [[]]
+        per_row = pd.Series(parsed, dtype=object).take(codes)
+        exploded = pd.Series(per_row.to_numpy(), index=np.arange(len(df), dtype=np.int32)).explode().dropna()
+        tables[kind] = pd.DataFrame({
+            'row': exploded.index.to_numpy(dtype=np.int32),
+            'skill': exploded.astype('category').array,
+        })
+
+    malformed = pd.DataFrame(malformed, columns=['row', 'kind', 'value'])
+    if len(malformed):
+        print(f"Found {len(malformed)} malformed skill lists, first rows: {malformed['row'].head(10).tolist()}")
+    return tables, malformed
+
+
+def append_skill_tables(tables, batch_tables, offset):
+    # Skill tables of a batch whose rows start at offset, appended to the tables of the listings before it
+    return {
+        kind: pd.DataFrame({
+            'row': np.concatenate([table['row'].to_numpy(), batch_tables[kind]['row'].to_numpy() + offset]).astype(
+                np.int32),
+            'skill': _append_column(table['skill'], batch_tables[kind]['skill']).array,
+        })
+        for kind, table in tables.items()
+    }
+
+
+# Category columns the skill rankings are broken down by; listings without a category count as 'Other'
+SKILL_GROUPINGS = {'level': 'des_category_level', 'domain': 'des_category_domain'}
+
+
+def _factorize_with_other(series):
+    # Like pd.factorize, but missing values become an 'Other' group; works for object and categorical columns
+    codes, groups = pd.factorize(series)
+    groups = pd.Index(groups, dtype=object)
+    if (codes == -1).any():
+        if 'Other' not in groups:
+            groups = groups.append(pd.Index(['Other'], dtype=object))
+        codes = np.where(codes == -1, groups.get_loc('Other'), codes)
+    return codes, groups
+
+
+def count_skills(df, skill_tables):
+    # Skill occurrence counts keyed by (kind, grouping); grouping None holds the overall counts.
+    # Counting is a single bincount over combined (group, skill) codes.
+    counts = {}
+    for kind, table in skill_tables.items():
+        skill_codes = table['skill'].cat.codes.to_numpy().astype(np.int64)
+        skills = table['skill'].cat.categories
+        counts[(kind, None)] = pd.Series(np.bincount(skill_codes, minlength=len(skills)), index=skills)
+
+        rows = table['row'].to_numpy()
+        for grouping, column in SKILL_GROUPINGS.items():
+            group_codes, groups = _factorize_with_other(df[column])
+            combined = group_codes[rows].astype(np.int64) * len(skills) + skill_codes
+            flat = np.bincount(combined, minlength=len(groups) * len(skills))
+            grouped = pd.Series(flat, index=pd.MultiIndex.from_product([groups, skills], names=['group', 'skill']))
+            counts[(kind, grouping)] = grouped[grouped > 0]
+    return counts
+
+
+def merge_skill_counts(total, counts):
+    for key, series in counts.items():
+        total[key] = total[key].add(series, fill_value=0).astype(np.int64) if key in total else series
+    return total
+
+
+def rank_skills(counts, top_n=10):
+    # Shape the counts like the files under skills_datasets/, keyed by file name without extension
+    rankings = {}
+    for (kind, grouping), series in counts.items():
+        if grouping is None:
+            top = series.sort_index().sort_values(ascending=False, kind='stable').head(top_n)
+            rankings[f'top_{top_n}_{kind}_skills'] = pd.DataFrame({'Skill': top.index.astype(str), 'Count': top.values})
+            continue
+
+        ranked = series.reset_index(name='count').sort_values(
+            ['group', 'count', 'skill'], ascending=[True, False, True])
+        ranked['rank'] = ranked.groupby('group').cumcount() + 1
+        ranked = ranked[ranked['rank'] <= top_n]
+        wide = ranked.pivot(index='group', columns='rank', values='skill').reindex(columns=range(1, top_n + 1))
+        wide.columns = [f"Top {rank} {kind.title()} Skill" for rank in wide.columns]
+        rankings[f'top_{kind}_skills_by_{grouping}'] = wide.rename_axis(grouping.title()).reset_index()
+    return rankings
+
+
+def build_skill_rankings(df, skill_tables, top_n=10):
+    return rank_skills(count_skills(df, skill_tables), top_n)
+
+
+def build_skill_rankings_chunked(filepath, chunksize=500000, top_n=10):
+    # Same rankings for CSVs too large to hold at once; only the running counts stay in memory
+    columns = list(SKILL_COLUMNS.values()) + list(SKILL_GROUPINGS.values())
+    total = {}
+    for chunk in pd.read_csv(filepath, usecols=columns, chunksize=chunksize):
+        chunk = chunk.reset_index(drop=True)
+        skill_tables, _ = normalize_skills(chunk)
+        merge_skill_counts(total, count_skills(chunk, skill_tables))
+    return rank_skills(total, top_n)
+
+
+def write_skill_rankings(rankings, directory='skills_datasets'):
+    os.makedirs(directory, exist_ok=True)
+    for name, frame in rankings.items():
+        frame.to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+
+
+# Locations look like "Austin, TX"; these don't name a place and are left out of the map
+NON_GEOGRAPHIC_LOCATIONS = ['Anywhere', 'United States']
+LOCATION_PATTERN = re.compile(r'^\s*(?P<city>.*?)\s*,\s*(?P<state>[A-Z]{2})$')
+
+
+def normalize_locations(locations):
+    # Parse each distinct location string once and map the column through the result
+    uniques = pd.Series(locations.dropna().unique(), dtype=object)
+    uniques = uniques[~uniques.isin(NON_GEOGRAPHIC_LOCATIONS)]
+    parts = uniques.str.extract(LOCATION_PATTERN)
+    return pd.DataFrame({
+        'city': locations.map(dict(zip(uniques, parts['city']))),
+        'state': locations.map(dict(zip(uniques, parts['state']))),
+    }, index=locations.index)
+
+
+def _places(locations, by):
+    # City names repeat across states, so cities are keyed on 'City, ST'
+    places = normalize_locations(locations)
+    if by == 'city':
+        return places['city'] + ', ' + places['state']
+    return places[by]
+
+
+def count_locations(df, by='state'):
+    # Additive per-place counts: listings, yearly salary values and domains
+    places = _places(df['location'], by)
+    yearly_salary = df['salary_avg'].where(df['salary_period'] == 'year')
+    return {
+        by: places.value_counts(),
+        f'{by}_salary': pd.DataFrame({by: places, 'salary': yearly_salary}).groupby([by, 'salary']).size(),
+        f'{by}_domain': pd.DataFrame({by: places, 'domain': df['des_category_domain'].astype(object)}).groupby(
+            [by, 'domain']).size(),
+    }
+
+
+def location_aggregates(counts, by='state'):
+    # Listing count, median yearly salary and most common domain per place, from count_locations output
+    aggregates = pd.DataFrame({'count': counts[by][counts[by] > 0]}).sort_index()
+    salary_counts = counts[f'{by}_salary']
+    salary_counts = salary_counts[salary_counts > 0]
+    aggregates['median_salary'] = pd.Series(
+        {place: quantile_from_counts(values.droplevel(by), 0.5) for place, values in salary_counts.groupby(level=by)},
+        dtype=float)
+
+    domain_counts = counts[f'{by}_domain']
+    domain_counts = domain_counts[domain_counts > 0].sort_index().sort_values(ascending=False, kind='stable')
+    top_domain = domain_counts.reset_index().drop_duplicates(by).set_index(by)['domain']
+    aggregates['top_domain'] = top_domain.reindex(aggregates.index).astype(object)
+
+    aggregates = aggregates.rename_axis(by).reset_index()
+    if by == 'city':
+        # The state of each city, for drilling down from the state map
+        aggregates.insert(1, 'state', aggregates['city'].str[-2:])
+    return aggregates
+
+
+def build_location_aggregates(df, by='state'):
+    return location_aggregates(count_locations(df, by), by)
+
+
+# Columns whose value counts are kept up to date as listings are ingested
+COUNTED_COLUMNS = ['platform', 'salary_range', 'des_category_level', 'des_category_domain']
+# Groupings of the salary percentiles; 'state' comes from count_locations
+SALARY_GROUPINGS = ['des_category_level', 'des_category_domain', 'state']
+SALARY_PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def count_salaries(df, columns=CATEGORY_COLUMNS):
+    # Additive (category, yearly salary) counts. Parsed salaries repeat heavily, so these histograms are small
+    # and merge exactly, which makes them a mergeable sketch of each category's salary distribution.
+    yearly_salary = df['salary_avg'].where(df['salary_period'] == 'year')
+    return {f'{column}_salary': pd.DataFrame({column: df[column].astype(object), 'salary': yearly_salary}).groupby(
+        [column, 'salary']).size() for column in columns}
+
+
+def salary_percentiles(salary_counts, percentiles=SALARY_PERCENTILES):
+    # Listing count and salary percentiles per group from (group, salary) -> count, with the same linear
+    # interpolation as Series.quantile. All groups and percentiles are looked up in one pass over the
+    # cumulative counts: each group's positions are offset by the listings of the groups before it.
+    columns = ['count'] + [f'p{round(q * 100)}' for q in percentiles]
+    salary_counts = salary_counts[salary_counts > 0].sort_index()
+    if salary_counts.empty:
+        return pd.DataFrame(columns=columns)
+    group_codes, groups = pd.factorize(salary_counts.index.get_level_values(0))
+    values = salary_counts.index.get_level_values(1).to_numpy(dtype=float)
+    cumulative = salary_counts.to_numpy().cumsum()
+
+    ends = np.flatnonzero(np.append(group_codes[1:] != group_codes[:-1], True))
+    starts = np.append(0, cumulative[ends[:-1]])
+    totals = cumulative[ends] - starts
+    position = (totals[:, None] - 1) * np.asarray(percentiles)[None, :]
+    lower = values[np.searchsorted(cumulative, starts[:, None] + np.floor(position), side='right')]
+    upper = values[np.searchsorted(cumulative, starts[:, None] + np.ceil(position), side='right')]
+    quantiles = lower + (upper - lower) * (position - np.floor(position))
+
+    stats = pd.DataFrame(quantiles, index=pd.Index(groups, name=salary_counts.index.names[0]), columns=columns[1:])
+    stats.insert(0, 'count', totals)
+    return stats
+
+
+def salary_statistics(counts, groupings=SALARY_GROUPINGS, percentiles=SALARY_PERCENTILES):
+    # {grouping: salary_percentiles frame} from count_listings output
+    return {by: salary_percentiles(counts[f'{by}_salary'], percentiles) for by in groupings}
+
+
+def count_listings(df, skill_tables):
+    # Additive counts behind the dashboard's aggregates; the counts of a delta batch merge into the running ones
+    counts = {}
+    for column in COUNTED_COLUMNS:
+        value_counts = df[column].value_counts(sort=False)
+        counts[column] = value_counts.set_axis(value_counts.index.astype(object))
+    counts.update(count_locations(df))
+    counts.update(count_salaries(df))
+    counts['cube_salary'] = count_salary_cube(df)
+    counts['skills'] = count_skills(df, skill_tables)
+    return counts
+
+
+def merge_listing_counts(total, counts):
+    # Returns the merged counts; total is left as it is
+    merged = dict(total)
+    for key, series in counts.items():
+        if key == 'skills':
+            merged[key] = merge_skill_counts(dict(total.get(key, {})), series)
+        else:
+            merged[key] = total[key].add(series, fill_value=0).astype(np.int64) if key in total else series
+    return merged
+
+
+@timed('pandas')
+def skills_for_rows(table, row_ids):
+    # Comma-joined skills for each row position, looked up by binary search over the sorted row column
+    rows = table['row'].to_numpy()
+    codes = table['skill'].cat.codes.to_numpy()
+    categories = table['skill'].cat.categories.to_numpy()
+    starts = np.searchsorted(rows, row_ids, side='left')
+    ends = np.searchsorted(rows, row_ids, side='right')
+    return [', '.join(categories[codes[start:end]]) for start, end in zip(starts, ends)]
+
+
+def build_search_index(df):
+    # (job category, location) -> sorted row positions; a job matches on either its level or its domain category
+    index = {}
+    for column in ['des_category_level', 'des_category_domain']:
+        for key, positions in df.groupby([column, 'location'], sort=False, observed=True).indices.items():
+            index[key] = np.union1d(index[key], positions) if key in index else positions
+    return index
+
+
+def extend_search_index(index, batch, offset):
+    # Index of the listings with batch appended at offset; positions stay sorted, since the batch's come last.
+    # Entries the batch doesn't touch are shared with index, which is left as it is.
+    extended = dict(index)
+    for key, positions in build_search_index(batch).items():
+        positions = positions + offset
+        extended[key] = np.concatenate([extended[key], positions]) if key in extended else positions
+    return extended
+
+
+@timed('pandas')
+def search_listings(index, job, location):
+    return index.get((job, location), np.empty(0, dtype=np.intp))
+
+
+@timed('pandas')
+def search_page(index, job, location, page=1, page_size=50):
+    # Row positions for one 1-based page of matches, plus the total number of matches
+    row_ids = search_listings(index, job, location)
+    start = (page - 1) * page_size
+    return row_ids[start:start + page_size], len(row_ids)
+
+
+@timed('pandas')
+def job_title_counts(df, column, selected_category, top_N=10):
+    # Ties in count are ordered by name, as in query_backend.job_title_counts
+    if not selected_category:
+        title_category_counts = df[column].value_counts().reset_index()
+        title_category_counts.columns = ['Job Title Category', 'Count']
+        title_category_counts = title_category_counts[title_category_counts['Count'] > 0].astype(
+            {'Job Title Category': object})
+        return title_category_counts.sort_values(by=['Count', 'Job Title Category'], ascending=[False, True],
+                                                 ignore_index=True)
+
+    filtered_df = df[df[column] == selected_category]
+    title_counts = filtered_df['title'].value_counts().reset_index()
+    title_counts.columns = ['Job Title', 'Count']
+    # Categorical columns also list unused titles, in category order rather than by name
+    title_counts = title_counts[title_counts['Count'] > 0].astype({'Job Title': object})
+    title_counts = title_counts.sort_values(by=['Count', 'Job Title'], ascending=[False, True], ignore_index=True)
+
+    # Limit to top N job titles and group the rest into 'Others'
+    if len(title_counts) > top_N:
+        other_count = title_counts[top_N:]['Count'].sum()
+        others = pd.DataFrame({'Job Title': ['Others'], 'Count': [other_count]})
+        title_counts = pd.concat([title_counts[:top_N], others], ignore_index=True)
+    return title_counts
+
+
 def map_salary_to_range(salary):
+    # Scalar counterpart of parse_salaries for one-off lookups
     if salary == "Not specified":
         return None
-    elif "a year" in salary:
-        if "-" in salary:
-            low, high = salary.split("-")
-            low = int(low.replace(",", ""))
-            high = int(high.split()[0].replace(",", ""))
-            avg = (low + high) / 2
-        else:
-            avg = int(salary.split()[0].replace(",", ""))
-
-        if avg < 50000:
-            return "<50k"
-        elif 50000 <= avg < 75000:
-            return "50k-75k"
-        elif 75000 <= avg < 100000:
-            return "75k-100k"
-        elif 100000 <= avg < 125000:
-            return "100k-125k"
-        elif 125000 <= avg < 150000:
-            return "125k-150k"
-        elif 150000 <= avg < 175000:
-            return "150k-175k"
-        elif 175000 <= avg < 200000:
-            return "175k-200k"
-        else:
-            return "200k+"
-    else:
+    match = SALARY_PATTERN.match(salary)
+    if not match or (match['period'] or '').lower() != 'year':
         return "Other"
+    low = float(match['low'].replace(',', ''))
+    high = float(match['high'].replace(',', '')) if match['high'] else low
+    return SALARY_LABELS[bisect.bisect_right(SALARY_BINS, (low + high) / 2) - 1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dataset maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('refresh', help="Fetch the dataset and rewrite the local snapshot if it changed")
+    stream_parser = subparsers.add_parser('stream', help="Process a CSV in chunks into a partitioned Parquet store")
+    stream_parser.add_argument('csv')
+    stream_parser.add_argument('output_dir')
+    stream_parser.add_argument('--chunksize', type=int, default=200000)
+    skills_parser = subparsers.add_parser('skills', help="Recompute the skills_datasets tables from the listings")
+    skills_parser.add_argument('--csv', help="Read listings from this CSV in chunks instead of the snapshot")
+    skills_parser.add_argument('--chunksize', type=int, default=500000)
+    skills_parser.add_argument('--output-dir', default='skills_datasets')
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        df = load_data(refresh=True)
+        if df is None:
+            raise SystemExit("Refresh failed and no snapshot is available")
+        print(f"Snapshot {snapshot_version()} with {len(df)} rows at {SNAPSHOT_PATH}")
+
+    elif args.command == 'skills':
+        if args.csv:
+            rankings = build_skill_rankings_chunked(args.csv, args.chunksize)
+        else:
+            df = load_data()
+            if df is None:
+                raise SystemExit("No dataset available")
+            rankings = build_skill_rankings(df, normalize_skills(df)[0])
+        write_skill_rankings(rankings, args.output_dir)
+        print(f"Wrote {len(rankings)} skill tables to {args.output_dir}")
+
+    elif args.command == 'stream':
+        summary = process_data_streaming(args.csv, args.output_dir, args.chunksize)
+        print(f"Kept {summary['rows_out']} of {summary['rows_in']} rows in {summary['partitions']} partitions")
@@ -0,0 +1,528 @@
+import argparse
+import contextlib
+import functools
+import hashlib
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import query_backend
+from data_processing import (append_listings, append_skill_tables, attach_frames, build_search_index, count_listings,
+                             des_categories_by_level, des_categories_by_domain, extend_search_index, listing_keys,
+                             load_data, location_aggregates, merge_listing_counts, normalize_skills, prepare_listings,
+                             publish_frames, rank_skills, salary_bounds, salary_cube_from_counts, salary_statistics,
+                             snapshot_version)
+
+# Process-wide registry of the dataset and everything derived from it.
+# Each artifact is built once on first use and shared by layout.py and the callbacks in app.py.
+# Every artifact has its own build lock, so independent artifacts can be built from different threads.
+# The artifacts of one dataset version live in a state dict; a new version is built into a fresh state off
+# the request path and swapped in whole (see refresh.py), while each request stays pinned to the state it
+# started with. Caches that keep files or entries per version clean up in on_retire() hooks, which run once a
+# swapped-out state is no longer pinned by any request.
+_lock = threading.RLock()  # held briefly: pin bookkeeping, swaps and the list of states
+_ingest_lock = threading.Lock()  # one ingest at a time; the new state is built without _lock
+_builders = {}
+_dependencies = {}
+_generation = 0
+_local = threading.local()
+_retire_hooks = []
+
+
+def _new_state():
+    # version: identifies the data for the caches; source: snapshot hash the listings were loaded from;
+    # revisions: version each artifact was last changed in; pins: threads currently reading the state;
+    # staged: being built, not swapped in yet; released: row frames dropped, see release_row_frames
+    return {'artifacts': {}, 'revisions': {}, 'build_locks': {}, 'version': None, 'source': None, 'pins': 0,
+            'staged': False, 'released': frozenset()}
+
+
+_current = _new_state()
+_states = [_current]  # the live state, states being staged and swapped-out states still pinned
+
+# Set to 1 when several worker processes serve the app: the first one to load a snapshot publishes the prepared
+# listings, their keys and the skill tables as Arrow files, and the others memory-map them instead of
+# building their own copies. Run `python dataset_registry.py publish` before starting the workers to build
+# them once up front.
+SHARED_DATASET = os.environ.get('DASHBOARD_SHARED_DATASET', '0') == '1'
+
+
+def register(name, builder, depends=()):
+    _builders[name] = builder
+    _dependencies[name] = tuple(depends)
+
+
+def _state():
+    return getattr(_local, 'state', None) or _current
+
+
+def pin(state=None):
+    # Until unpin(), get() in this thread keeps reading state (the live one by default), even when another
+    # version is swapped in meanwhile. Returns what to pass to unpin().
+    previous = getattr(_local, 'state', None)
+    with _lock:
+        state = state or _state()
+        state['pins'] += 1
+    _local.state = state
+    return previous
+
+
+def unpin(previous=None):
+    state = getattr(_local, 'state', None)
+    _local.state = previous
+    if state is not None:
+        with _lock:
+            state['pins'] -= 1
+        _retire(state)
+
+
+@contextlib.contextmanager
+def pinned(state=None):
+    previous = pin(state)
+    try:
+        yield _local.state
+    finally:
+        unpin(previous)
+
+
+def staging():
+    # Empty state to build the next dataset version into, under pinned(); nothing reads it before swap().
+    # Pass it to discard() instead when the build fails.
+    state = _new_state()
+    state['staged'] = True
+    with _lock:
+        _states.append(state)
+    return state
+
+
+def swap(state, expected=None):
+    # With expected, the swap only happens while expected is still the live state; returns whether it happened
+    global _current
+    with _lock:
+        if expected is not None and _current is not expected:
+            return False
+        previous, _current = _current, state
+        state['staged'] = False
+        if not any(live is state for live in _states):
+            _states.append(state)
+    if previous is not state:
+        _retire(previous)
+    return True
+
+
+def discard(state):
+    with _lock:
+        state['staged'] = False
+    _retire(state)
+
+
+def on_retire(hook):
+    # hook() runs after a state is swapped out and released; live_states() no longer includes it by then
+    _retire_hooks.append(hook)
+
+
+def _retire(state):
+    with _lock:
+        if state is _current or state['pins'] or state['staged'] or not any(live is state for live in _states):
+            return
+        _states[:] = [live for live in _states if live is not state]
+    cleanup()
+
+
+def cleanup():
+    # Runs the on_retire hooks: caches drop what no live state uses. Cleanup never fails a request.
+    for hook in _retire_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"Error cleaning up after a dataset swap: {e}")
+
+
+def live_states():
+    with _lock:
+        return list(_states)
+
+
+def live_versions():
+    return {state['version'] for state in live_states() if state['version'] is not None}
+
+
+def live_keys(depends=None):
+    # The version, or the revisions of depends, of every state still in use: what caches keyed on them keep
+    return {_revision_key(state, depends) if depends else state['version'] for state in live_states()}
+
+
+def get(name):
+    state = _state()
+    artifacts = state['artifacts']
+    if name in artifacts:
+        return artifacts[name]
+    if name in state['released']:
+        raise RuntimeError(f"{name} was released once the query database held the listings")
+    with _lock:
+        build_lock = state['build_locks'].setdefault(name, threading.RLock())
+    with build_lock:
+        if name not in artifacts:
+            artifacts[name] = _freeze(_builders[name]())
+            state['revisions'][name] = state['version']
+        return artifacts[name]
+
+
+def stages():
+    # Every registered artifact as a startup stage: (dependencies, build function)
+    return {name: (_dependencies[name], functools.partial(get, name)) for name in _builders}
+
+
+def view(name):
+    # What callbacks read shared frames through. Shallow copy: shares the underlying column data, which is read-only
+    # (see _freeze), and adding or replacing columns on the returned frame never leaks into the shared artifact
+    return get(name).copy(deep=False)
+
+
+def _loaded():
+    # The state, with its listings loaded (or released, after they were loaded)
+    state = _state()
+    if 'listings' not in state['released']:
+        get('listings')
+    return state
+
+
+def version():
+    # Identifies the loaded dataset; caches key on it so they invalidate when the snapshot changes
+    return _loaded()['version']
+
+
+def source():
+    # Hash of the snapshot the listings were loaded from, None without one; ingest() leaves it unchanged
+    return _loaded()['source']
+
+
+def revision(names, build=True):
+    # Changes whenever one of the named artifacts changes. Like the version, it is the same in every worker that
+    # loaded the same snapshot and ingested the same batches, unless the version is local to this process.
+    # With build=False, None unless all of them are built already.
+    state = _state()
+    if not build and any(name not in state['artifacts'] for name in names):
+        return None
+    for name in names:
+        get(name)
+    return _revision_key(state, names)
+
+
+def _revision_key(state, names):
+    return '/'.join(f"{name}@{state['revisions'].get(name)}" for name in names)
+
+
+def clear():
+    swap(_new_state())
+
+
+def _sizeof(obj):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(_sizeof(item) for item in obj)
+    return sys.getsizeof(obj)
+
+
+def _freeze(obj):
+    # Marks the arrays behind an artifact read-only, so an in-place write from any caller raises instead of changing
+    # what every other request reads. Frames are frozen block by block, as pandas exposes no public way to do it.
+    # Object arrays (strings in the small aggregates) stay writable: pandas 2.1 can't compare read-only ones.
+    if isinstance(obj, np.ndarray):
+        if obj.dtype != object:
+            obj.flags.writeable = False
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        for values in obj._mgr.arrays:
+            # Categorical and other NumPy-backed extension arrays keep their data in _ndarray
+            _freeze(values if isinstance(values, np.ndarray) else getattr(values, '_ndarray', None))
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _freeze(value)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _freeze(item)
+    return obj
+
+
+def memory_report():
+    # Bytes held by each artifact that has been built so far
+    with _lock:
+        return {name: _sizeof(artifact) for name, artifact in _state()['artifacts'].items()}
+
+
+def _shared_version():
+    # Only the snapshot as loaded is shared; ingested batches and local loads stay in their own process
+    version = snapshot_version()
+    return version if SHARED_DATASET and version and _state()['version'] in (None, version) else None
+
+
+def _build_listings():
+    # Salary strings are parsed once here; every view of the listings carries the salary_* columns.
+    # Listing keys are kept sorted alongside as 'listing_keys', for deduplicating ingested batches.
+    state = _state()
+    state['version'] = None
+    shared_version = _shared_version()
+    frames = attach_frames(['listings', 'listing_keys'], shared_version) if shared_version else None
+    if frames is not None:
+        state['artifacts']['listing_keys'] = _freeze(frames['listing_keys']['key'].to_numpy())
+        state['version'] = state['source'] = shared_version
+        return frames['listings']
+
+    raw = load_data()
+    state['artifacts']['listing_keys'] = _freeze(np.sort(listing_keys(raw)))
+    df = prepare_listings(raw)
+    # The version comes with the data, never from a separate read that another worker's refresh could overtake
+    state['source'] = raw.attrs.get('snapshot_version')
+    state['version'] = state['source'] or _local_version()
+    if _shared_version():
+        publish_frames({'listings': df, 'listing_keys': pd.DataFrame({'key': state['artifacts']['listing_keys']})},
+                       state['version'])
+    return df
+
+
+def _local_version():
+    global _generation
+    with _lock:
+        _generation += 1
+        return f"local-{_generation}"
+
+
+def _build_listing_keys():
+    get('listings')
+    return _state()['artifacts']['listing_keys']
+
+
+def _build_skills():
+    # Long (row, skill) tables per skill kind; the malformed-value report is kept alongside as 'skill_errors'
+    listings = get('listings')
+    shared_version = _shared_version()
+    frames = attach_frames(['skills_hard', 'skills_soft', 'skill_errors'], shared_version) if shared_version else None
+    if frames is not None:
+        _state()['artifacts']['skill_errors'] = _freeze(frames['skill_errors'])
+        return {'hard': frames['skills_hard'], 'soft': frames['skills_soft']}
+
+    tables, malformed = normalize_skills(listings)
+    _state()['artifacts']['skill_errors'] = _freeze(malformed)
+    if shared_version:
+        publish_frames({'skills_hard': tables['hard'], 'skills_soft': tables['soft'], 'skill_errors': malformed},
+                       shared_version)
+    return tables
+
+
+def _build_skill_errors():
+    get('skills')
+    return _state()['artifacts']['skill_errors']
+
+
+def _build_job_options():
+    # Combine job categories for dropdown, removing duplicates while keeping a stable order
+    all_jobs = list(des_categories_by_level.keys()) + list(des_categories_by_domain.keys())
+    return [{'label': job, 'value': job} for job in dict.fromkeys(all_jobs)]
+
+
+def _build_location_options():
+    return [{'label': location, 'value': location} for location in get('listings')['location'].unique()]
+
+
+register('listings', _build_listings)
+register('listing_keys', _build_listing_keys, depends=['listings'])
+register('skills', _build_skills, depends=['listings'])
+register('skill_errors', _build_skill_errors, depends=['skills'])
+register('listing_counts', lambda: count_listings(get('listings'), get('skills')), depends=['listings', 'skills'])
+register('skill_rankings', lambda: rank_skills(get('listing_counts')['skills']), depends=['listing_counts'])
+register('search_index', lambda: build_search_index(get('listings')), depends=['listings'])
+register('state_aggregates', lambda: location_aggregates(get('listing_counts')), depends=['listing_counts'])
+register('platform_counts', lambda: get('listing_counts')['platform'], depends=['listing_counts'])
+register('salary_range_counts', lambda: get('listing_counts')['salary_range'], depends=['listing_counts'])
+register('salary_stats', lambda: salary_statistics(get('listing_counts')), depends=['listing_counts'])
+register('salary_cube', lambda: salary_cube_from_counts(get('listing_counts')['cube_salary']),
+         depends=['listing_counts'])
+register('job_options', _build_job_options)
+register('location_options', _build_location_options, depends=['listings'])
+if query_backend.ENABLED:
+    on_retire(lambda: query_backend.remove_unused(live_versions()))
+    register('query_db', lambda: query_backend.export(get('listings'), get('skills'), version(),
+                                                      salary_bounds(get('listing_counts')['cube_salary'])),
+             depends=['listings', 'skills', 'listing_counts'])
+
+# With the query backend, requests read the database rather than the row frames, so each worker drops them once
+# the database and everything else built from them is in place. Its memory then follows the number of groups
+# (counts, aggregates, figures) plus 8 bytes of listing key per row; ingest() appends batches to the database.
+ROW_FRAMES = ['listings', 'skills']
+BUILT_FROM_ROW_FRAMES = ['listing_keys', 'skill_errors', 'listing_counts', 'location_options', 'query_db']
+
+# Rebuilt from the merged counts by ingest() when built already; cheap, since their size depends on the number of
+# groups only
+DERIVED_FROM_COUNTS = ['skill_rankings', 'state_aggregates', 'platform_counts', 'salary_range_counts',
+                       'salary_stats', 'salary_cube']
+
+
+def release_row_frames():
+    # Builds what requests need from the row frames, then drops them from this thread's state; get() raises for
+    # them afterwards rather than reload the snapshot, which would lose ingested batches. No-op without the backend.
+    if not query_backend.ENABLED:
+        return
+    for name in BUILT_FROM_ROW_FRAMES:
+        get(name)
+    state = _state()
+    with _lock:
+        state['released'] = state['released'] | set(ROW_FRAMES)
+        for name in ROW_FRAMES:
+            state['artifacts'].pop(name, None)
+
+
+def _same(a, b):
+    if isinstance(a, (pd.DataFrame, pd.Series)):
+        return type(a) is type(b) and a.equals(b)
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(_same(a[key], b[key]) for key in a)
+    return a == b
+
+
+def _dependents(names, settled=()):
+    # Every artifact built, directly or not, from one of names; artifacts in settled are up to date and
+    # neither count as stale nor make their own dependents stale
+    stale = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, depends in _dependencies.items():
+            if name not in stale and name not in settled and stale.union(names).intersection(depends):
+                stale.add(name)
+                changed = True
+    return stale - set(names)
+
+
+def _extend_location_options(options, batch):
+    known = {option['value'] for option in options}
+    return options + [{'label': location, 'value': location} for location in batch['location'].unique()
+                      if location not in known]
+
+
+# Updated by ingest() from the appended batch alone, when they are built already: name -> (artifact, batch, offset)
+EXTENDED_BY_BATCH = {
+    'search_index': extend_search_index,
+    'location_options': lambda options, batch, offset: _extend_location_options(options, batch),
+}
+
+
+def ingest(batch):
+    # Adds the listings of a raw delta batch that aren't loaded yet and returns how many were added.
+    # The listing counts are merged and the aggregates derived from them rebuilt, and the search index, location
+    # options and query database are extended with the batch, so their cost follows the batch size rather than
+    # the history. Row frames released for the query database stay released.
+    # Any other artifact built from the listings that was in use is rebuilt here, before the swap, so no request
+    # builds it. An artifact whose new value equals the old one keeps its revision, so callbacks and figures
+    # built from it stay cached. The result is swapped in as a new state, so requests in flight keep the old one.
+    # Requests are never held up: the new state is built without _lock. When a refresh swaps in another version
+    # meanwhile, the batch is ingested again on top of that one.
+    # Ingested listings live in memory only: a reload from the snapshot drops them.
+    with _ingest_lock:
+        while True:
+            with pinned(_current) as current:
+                ingested = _ingested(current, batch)
+                if ingested is None:
+                    return 0
+                state, added, changed, rebuild = ingested
+                if swap(state, expected=current):
+                    break
+        print(f"Ingested {added} of {len(batch)} listings, updated {sorted(changed)}, rebuilt {sorted(rebuild)}")
+        return added
+
+
+def _ingested(current, batch):
+    # (new state, listings added, updated artifacts, rebuilt artifacts) for batch on top of current, which this
+    # thread has pinned; None when the batch adds nothing
+    released = current['released']
+    known = get('listing_keys')
+    skill_errors = get('skill_errors')
+    counts = get('listing_counts')
+
+    keys = listing_keys(batch)
+    fresh = np.zeros(len(keys), dtype=bool)
+    fresh[np.unique(keys, return_index=True)[1]] = True  # first occurrence within the batch
+    if len(known):
+        positions = np.searchsorted(known, keys).clip(max=len(known) - 1)
+        fresh &= known[positions] != keys
+    if not fresh.any():
+        return None
+
+    batch = prepare_listings(batch[fresh].reset_index(drop=True))
+    batch_skills, batch_errors = normalize_skills(batch)
+    new_keys = np.sort(keys[fresh])
+    offset = len(known)  # one key per listing
+    updated = {
+        'listing_keys': np.insert(known, np.searchsorted(known, new_keys), new_keys),
+        'skill_errors': pd.concat([skill_errors, batch_errors.assign(row=batch_errors['row'] + offset)],
+                                  ignore_index=True),
+        'listing_counts': merge_listing_counts(counts, count_listings(batch, batch_skills)),
+    }
+    if 'listings' not in released:
+        updated['listings'] = append_listings(get('listings'), batch)
+    if 'skills' not in released:
+        updated['skills'] = append_skill_tables(get('skills'), batch_skills, offset)
+    state = dict(_new_state(), artifacts=dict(current['artifacts']), revisions=dict(current['revisions']),
+                 source=current['source'], released=released)
+    if current['version'].startswith('local-'):
+        state['version'] = _local_version()
+    else:
+        # Same snapshot plus the same batches gives the same version in every worker
+        state['version'] = hashlib.sha256(current['version'].encode() + new_keys.tobytes()).hexdigest()
+
+    artifacts, revisions = state['artifacts'], state['revisions']
+    for name, extend in EXTENDED_BY_BATCH.items():
+        if name in artifacts:
+            updated[name] = extend(artifacts[name], batch, offset)
+    if 'query_db' in artifacts:
+        updated['query_db'] = query_backend.extend(artifacts['query_db'], batch, batch_skills, offset,
+                                                   state['version'],
+                                                   salary_bounds(updated['listing_counts']['cube_salary']))
+    for name, artifact in updated.items():
+        artifacts[name] = _freeze(artifact)
+        revisions[name] = state['version']
+
+    changed = set(updated)
+    with pinned(state):
+        for name in DERIVED_FROM_COUNTS:
+            if name not in artifacts:
+                continue
+            artifact = _builders[name]()
+            if _same(artifacts[name], artifact):
+                continue
+            artifacts[name] = _freeze(artifact)
+            revisions[name] = state['version']
+            changed.add(name)
+
+        stale = _dependents(changed, settled=DERIVED_FROM_COUNTS + list(EXTENDED_BY_BATCH) + ['query_db'])
+        rebuild = [name for name in stale if name in artifacts]
+        for name in stale:
+            artifacts.pop(name, None)
+        for name in rebuild:
+            get(name)
+    return state, len(batch), changed, rebuild
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the dataset artifacts")
+    parser.add_argument('command', nargs='?', choices=['report', 'publish'], default='report',
+                        help="report: build everything and print its memory use; "
+                             "publish: build the shared files worker processes memory-map")
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        SHARED_DATASET = True
+        get('skills')
+        print(f"Published dataset version {version()}")
+    else:
+        for artifact in _builders:
+            get(artifact)
+        for artifact, size in memory_report().items():
+            print(f"{artifact:<20} {size / 1024 ** 2:10.2f} MiB")
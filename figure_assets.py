@@ -0,0 +1,145 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import flask
+from werkzeug.utils import safe_join
+
+import dataset_registry
+import figure_cache
+from data_processing import STALE_AFTER, remove_stale, touch
+
+# Figures that are the same for every visitor, exported as gzipped JSON files named after their content hash.
+# The browser loads them with a clientside callback (assets/figures.js), so a view costs no Python time: the page
+# layout carries the hashed URLs (see urls), and the files are cached for a year. Figures not exported yet, e.g.
+# with DASHBOARD_DEFER_STARTUP, are looked up in the manifest, which exports them on first request.
+# ASSET_DIR is shared by all workers, which may be on different dataset versions: each one renews the files its
+# manifests point to, and only files nobody has renewed for STALE_AFTER seconds are removed.
+ASSET_DIR = os.environ.get('DASHBOARD_FIGURE_ASSET_DIR', os.path.join('data_cache', 'figures'))
+URL_PREFIX = '/figures/'
+MAX_AGE = 365 * 24 * 3600
+
+_lock = threading.Lock()
+_exported = {}  # (name, dataset version or artifact revisions) -> file name
+_exported_depends = {}
+_renewed = {}  # file name -> when this process last touched it
+
+
+def _in_use(directory, filename):
+    # Renews the file now and then, well within STALE_AFTER; False when it is gone
+    now = time.time()
+    with _lock:
+        if now - _renewed.get(filename, 0) < STALE_AFTER / 4:
+            return True
+    if not touch(os.path.join(directory, filename)):
+        return False
+    with _lock:
+        _renewed[filename] = now
+    return True
+
+
+def _exported_file(name, depends, directory, build=True):
+    version = dataset_registry.revision(depends, build) if depends else dataset_registry.version()
+    if version is None:
+        return None
+    with _lock:
+        filename = _exported.get((name, version))
+    return filename if filename is not None and _in_use(directory, filename) else None
+
+
+def urls(app, builders, dependencies=None, directory=ASSET_DIR):
+    # {name: URL} of the figures already exported for the data this request reads, for the page layout.
+    # Nothing is built here; figures missing from it are loaded through the manifest.
+    url_prefix = app.get_relative_path(URL_PREFIX)
+    dependencies = dependencies or {}
+    exported = {name: _exported_file(name, dependencies.get(name), directory, build=False) for name in builders}
+    return {name: url_prefix + filename for name, filename in exported.items() if filename is not None}
+
+
+def export_figure(name, builder, depends=None, directory=ASSET_DIR):
+    # Writes <name>.<hash>.json.gz for the live data unless it is there already and returns its file name.
+    # Only this figure is built, so a manifest request for one graph never builds the others.
+    filename = _exported_file(name, depends, directory)
+    if filename is not None:
+        return filename
+    key = (name, dataset_registry.revision(depends) if depends else dataset_registry.version())
+
+    figure = figure_cache.get_figure(name, builder, depends)
+    payload = json.dumps(figure, separators=(',', ':')).encode()
+    filename = f"{name}.{hashlib.sha256(payload).hexdigest()[:16]}.json.gz"
+    path = os.path.join(directory, filename)
+    if not touch(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(payload, mtime=0))
+        os.replace(tmp_path, path)
+
+    with _lock:
+        # Entries for older data stay until the states using them are retired, see _remove_retired
+        _exported[key] = filename
+        _exported_depends[name] = depends
+        _renewed[filename] = time.time()
+    return filename
+
+
+def export(builders, dependencies=None, directory=ASSET_DIR):
+    # Exports every figure and returns {name: file name}
+    return {name: export_figure(name, builder, (dependencies or {}).get(name), directory)
+            for name, builder in builders.items()}
+
+
+def _remove_retired(directory=ASSET_DIR):
+    # Forgets the files of retired dataset states; of the files no live state points to, those no worker has
+    # renewed for STALE_AFTER seconds are removed
+    with _lock:
+        depends = dict(_exported_depends)
+    live = {name: dataset_registry.live_keys(names) for name, names in depends.items()}
+    with _lock:
+        for key in [k for k in _exported if k[1] not in live.get(k[0], ())]:
+            del _exported[key]
+        keep = set(_exported.values())
+    remove_stale(directory, keep=keep, select=lambda entry: entry.endswith('.json.gz'))
+
+
+dataset_registry.on_retire(_remove_retired)
+
+
+def serve(app, builders, dependencies=None, directory=ASSET_DIR):
+    server = app.server
+    url_prefix = app.get_relative_path(URL_PREFIX)
+
+    @server.route(URL_PREFIX + 'manifest.json')
+    def figure_manifest():
+        # ?name= limits the manifest, and the figures built for it, to the named figures
+        names = flask.request.args.getlist('name') or list(builders)
+        if any(name not in builders for name in names):
+            flask.abort(404)
+        figures = {name: export_figure(name, builders[name], (dependencies or {}).get(name), directory)
+                   for name in names}
+        response = flask.jsonify({name: url_prefix + filename for name, filename in figures.items()})
+        # Revalidated on every view; unchanged manifests are answered with 304 Not Modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        return response.make_conditional(flask.request)
+
+    @server.route(URL_PREFIX + '<filename>')
+    def figure_asset(filename):
+        path = safe_join(directory, filename)
+        if not filename.endswith('.json.gz') or path is None or not os.path.isfile(path):
+            flask.abort(404)
+        if 'gzip' not in flask.request.headers.get('Accept-Encoding', ''):
+            with open(path, 'rb') as f:
+                response = flask.Response(gzip.decompress(f.read()), mimetype='application/json')
+        else:
+            response = flask.send_from_directory(os.path.abspath(directory), filename,
+                                                 mimetype='application/json', conditional=True)
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return app
@@ -0,0 +1,188 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import dash
+from plotly.io.json import to_json_plotly
+
+import dataset_registry
+from data_processing import remove_stale, touch
+from metrics import timed
+
+# Callback results shared between worker processes live under CACHE_DIR/<dataset version>/<callback>/, or under
+# CACHE_DIR/<hash of the artifact revisions>/<callback>/ for callbacks memoized with depends
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join('data_cache', 'callbacks'))
+
+# Serialized figures keyed by (name, dataset version), or by the revisions of the artifacts a figure is built from.
+# Figures are stored as plain JSON-ready dicts, so serving one skips plotly's figure validation and encoding.
+_lock = threading.Lock()
+_figures = {}
+_figure_depends = {}
+_stats = {}
+_memoized = []
+_memoized_depends = []
+
+
+@timed('serialize')
+def _to_json_ready(value):
+    # Same encoding Dash applies to callback outputs, decoded back into plain lists and dicts
+    return json.loads(to_json_plotly(value))
+
+
+def get_figure(name, builder, depends=None):
+    # With depends, the figure is only rebuilt when one of those registry artifacts changes
+    version = dataset_registry.revision(depends) if depends else dataset_registry.version()
+    key = (name, version)
+    with _lock:
+        if key in _figures:
+            return _figures[key]
+
+    figure = _to_json_ready(builder())
+
+    with _lock:
+        # Entries for older data stay until the states using them are retired, see _remove_retired
+        _figures[key] = figure
+        _figure_depends[name] = depends
+    return figure
+
+
+def warm(builders, dependencies=None):
+    for name, builder in builders.items():
+        get_figure(name, builder, (dependencies or {}).get(name))
+
+
+def _count(name, outcome):
+    with _lock:
+        counters = _stats.setdefault(name, {'hits': 0, 'disk_hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+
+def stats():
+    with _lock:
+        return {name: dict(counters) for name, counters in _stats.items()}
+
+
+def _disk_dir(version, depends):
+    return hashlib.sha1(version.encode()).hexdigest() if depends else version
+
+
+def _disk_path(directory, name, key):
+    return os.path.join(CACHE_DIR, directory, name, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+
+def _read_disk(path, ttl):
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(path) >= ttl:
+            return None
+        with open(path) as f:
+            value = json.load(f)
+    except (OSError, ValueError):
+        return None
+    touch(os.path.dirname(os.path.dirname(path)))
+    return value
+
+
+def _write_disk(path, directory, value):
+    # The disk cache only saves work: when it can't be written, the result is still returned and kept in memory
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing callback cache {path}: {e}")
+        return
+    touch(os.path.join(CACHE_DIR, directory))
+
+
+def _contains_no_update(result):
+    if isinstance(result, (list, tuple)):
+        return any(item is dash.no_update for item in result)
+    return result is dash.no_update
+
+
+# Memoize a callback on (callback, arguments, dataset version), or on the revisions of the registry artifacts in
+# depends instead of the version, so results stay cached across ingested batches that leave those unchanged.
+# Results are kept in a per-process LRU of maxsize entries and, when disk is set, in CACHE_DIR so other
+# workers can reuse them. Arguments named in ignore (e.g. click counters) are left out of the key.
+def memoize(maxsize=128, ttl=None, ignore=(), disk=True, depends=None):
+    def decorator(func):
+        name = func.__name__
+        signature = inspect.signature(func)
+        entries = OrderedDict()
+        entries_lock = threading.Lock()
+        _memoized.append(entries)
+        if depends:
+            _memoized_depends.append(depends)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            call_args = {arg: value for arg, value in bound.arguments.items() if arg not in ignore}
+            version = dataset_registry.revision(depends) if depends else dataset_registry.version()
+            key = json.dumps([name, version, call_args], sort_keys=True, default=str)
+            now = time.time()
+
+            with entries_lock:
+                entry = entries.get(key)
+                if entry is not None and (ttl is None or now - entry[0] < ttl):
+                    entries.move_to_end(key)
+                    _count(name, 'hits')
+                    return entry[1]
+
+            # Versions without a snapshot hash are local to this process, so they never go to disk
+            use_disk = disk and 'local-' not in version
+            directory = _disk_dir(version, depends)
+            path = _disk_path(directory, name, key) if use_disk else None
+            value = _read_disk(path, ttl) if use_disk else None
+            if value is not None:
+                _count(name, 'disk_hits')
+            else:
+                _count(name, 'misses')
+                result = func(*args, **kwargs)
+                if _contains_no_update(result):
+                    return result
+                value = _to_json_ready(result)
+                if use_disk:
+                    _write_disk(path, directory, value)
+
+            with entries_lock:
+                entries[key] = (now, value)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def _remove_retired():
+    # Figures no live dataset state uses anymore, and disk results of versions no worker has used for a while
+    with _lock:
+        depends = dict(_figure_depends)
+    live = {name: dataset_registry.live_keys(names) for name, names in depends.items()}
+    with _lock:
+        for key in [k for k in _figures if k[1] not in live.get(k[0], ())]:
+            del _figures[key]
+    keep = dataset_registry.live_versions()
+    for names in _memoized_depends:
+        keep |= {_disk_dir(key, names) for key in dataset_registry.live_keys(names)}
+    remove_stale(CACHE_DIR, keep=keep)
+
+
+dataset_registry.on_retire(_remove_retired)
+
+
+def clear():
+    with _lock:
+        _figures.clear()
+        for entries in _memoized:
+            entries.clear()
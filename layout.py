@@ -2,17 +2,14 @@ import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 
-from data_processing import des_categories_by_level, des_categories_by_domain, load_data
+import dataset_registry
 
-df = load_data()
-# Combine job categories for dropdown
-all_jobs = list(des_categories_by_level.keys()) + list(des_categories_by_domain.keys())
-unique_jobs = list(set(all_jobs))  # Remove duplicates
 
-
-def get_layout():
+def get_layout(figure_urls=None):
     layout = html.Div([
         dcc.Location(id='url', refresh=False),
+        dcc.Store(id='search-results-store'),  # The last search query and its match count, not the matches
+        dcc.Store(id='figure-urls', data=figure_urls or {}),  # Exported static figures, see figure_assets.py
         dbc.NavbarSimple(
             children=[
                 dbc.NavItem(dbc.NavLink("Home", href="/")),
@@ -30,13 +27,13 @@ def get_layout():
                     dbc.Col(width=2),  # Empty column for centering
                     dbc.Col(dcc.Dropdown(
                         id='job-search-dropdown',
-                        options=[{'label': job, 'value': job} for job in unique_jobs],
+                        options=dataset_registry.get('job_options'),
                         placeholder="Select a Job",
                         className="py-0"
                     ), width=3, className="px-2"),
                     dbc.Col(dcc.Dropdown(
                         id='location-search-dropdown',
-                        options=[{'label': location, 'value': location} for location in df['location'].unique()],
+                        options=dataset_registry.get('location_options'),
                         placeholder="Select a Location",
                         className="py-0"
                     ), width=3, className="px-2"),
@@ -0,0 +1,168 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+import flask
+
+# Per-callback latency and payload size for Dash callback requests, served as Prometheus text on /metrics.
+# Time inside functions decorated with timed(phase) is attributed to that phase ('pandas', 'figure',
+# 'serialize'); whatever is left of the request (Dash dispatch, response encoding) is counted as 'other'.
+LOG_CALLBACKS = os.environ.get('DASHBOARD_LOG_CALLBACKS') == '1'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('pandas', 'figure', 'serialize', 'other')
+
+_local = threading.local()
+_lock = threading.Lock()
+_callbacks = {}
+
+
+def timed(phase):
+    # Exclusive time: a timed function called from another timed function only counts once, in the inner phase.
+    # Outside of an instrumented request the wrapper just calls through.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            state = getattr(_local, 'request', None)
+            if state is None:
+                return func(*args, **kwargs)
+            stack = state['stack']
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                state['phases'][phase] = state['phases'].get(phase, 0.0) + elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+
+        return wrapper
+
+    return decorator
+
+
+def _callback_name(app, output):
+    callback = app.callback_map.get(output, {}).get('callback')
+    return getattr(callback, '__name__', None) or output
+
+
+def _record(name, duration, phases, size):
+    with _lock:
+        entry = _callbacks.setdefault(name, {
+            'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0,
+            'phases': dict.fromkeys(PHASES, 0.0), 'bytes': 0, 'max_bytes': 0,
+        })
+        index = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        if index < len(LATENCY_BUCKETS):
+            entry['buckets'][index] += 1
+        entry['count'] += 1
+        entry['sum'] += duration
+        for phase, seconds in phases.items():
+            entry['phases'][phase] += seconds
+        entry['bytes'] += size
+        entry['max_bytes'] = max(entry['max_bytes'], size)
+
+
+def snapshot():
+    with _lock:
+        return {name: {**entry, 'buckets': list(entry['buckets']), 'phases': dict(entry['phases'])}
+                for name, entry in _callbacks.items()}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(cache_stats=None):
+    lines = [
+        '# HELP dashboard_callback_duration_seconds Wall time of Dash callback requests.',
+        '# TYPE dashboard_callback_duration_seconds histogram',
+    ]
+    callbacks = snapshot()
+    for name, entry in sorted(callbacks.items()):
+        callback = _label(name)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, entry['buckets']):
+            cumulative += count
+            lines.append(
+                f'dashboard_callback_duration_seconds_bucket{{callback="{callback}",le="{bound}"}} {cumulative}')
+        lines.append(f'dashboard_callback_duration_seconds_bucket{{callback="{callback}",le="+Inf"}} {entry["count"]}')
+        lines.append(f'dashboard_callback_duration_seconds_sum{{callback="{callback}"}} {entry["sum"]:.6f}')
+        lines.append(f'dashboard_callback_duration_seconds_count{{callback="{callback}"}} {entry["count"]}')
+
+    lines += [
+        '# HELP dashboard_callback_phase_seconds_total Callback time split into pandas, figure, serialize and other.',
+        '# TYPE dashboard_callback_phase_seconds_total counter',
+    ]
+    for name, entry in sorted(callbacks.items()):
+        for phase in PHASES:
+            lines.append(f'dashboard_callback_phase_seconds_total{{callback="{_label(name)}",phase="{phase}"}} '
+                         f'{entry["phases"][phase]:.6f}')
+
+    lines += [
+        '# HELP dashboard_callback_response_bytes_total Bytes sent in Dash callback responses.',
+        '# TYPE dashboard_callback_response_bytes_total counter',
+    ]
+    for name, entry in sorted(callbacks.items()):
+        lines.append(f'dashboard_callback_response_bytes_total{{callback="{_label(name)}"}} {entry["bytes"]}')
+    lines += [
+        '# HELP dashboard_callback_response_bytes_max Largest Dash callback response seen, in bytes.',
+        '# TYPE dashboard_callback_response_bytes_max gauge',
+    ]
+    for name, entry in sorted(callbacks.items()):
+        lines.append(f'dashboard_callback_response_bytes_max{{callback="{_label(name)}"}} {entry["max_bytes"]}')
+
+    if cache_stats:
+        lines += [
+            '# HELP dashboard_cache_requests_total Memoized callback lookups by outcome.',
+            '# TYPE dashboard_cache_requests_total counter',
+        ]
+        for name, counters in sorted(cache_stats.items()):
+            for outcome, count in sorted(counters.items()):
+                lines.append(f'dashboard_cache_requests_total{{callback="{_label(name)}",outcome="{outcome}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def instrument(app, cache_stats=None):
+    # Hooks the Flask server behind a Dash app; cache_stats is an optional callable returning
+    # {callback: {outcome: count}} that is exported next to the callback metrics
+    server = app.server
+
+    @server.before_request
+    def _start_callback_timer():
+        if flask.request.path.endswith('/_dash-update-component'):
+            _local.request = {'start': time.perf_counter(), 'stack': [], 'phases': {}}
+
+    @server.after_request
+    def _record_callback(response):
+        state = getattr(_local, 'request', None)
+        if state is None:
+            return response
+        _local.request = None
+        duration = time.perf_counter() - state['start']
+        phases = state['phases']
+        phases['other'] = max(duration - sum(phases.values()), 0.0)
+        body = flask.request.get_json(silent=True) or {}
+        name = _callback_name(app, body.get('output', 'unknown'))
+        size = response.content_length
+        if size is None:
+            size = len(response.get_data())
+        _record(name, duration, phases, size)
+        if LOG_CALLBACKS:
+            split = ' '.join(f"{phase}={phases.get(phase, 0.0) * 1000:.1f}ms" for phase in PHASES)
+            print(f"callback {name}: {duration * 1000:.1f}ms ({split}) {size} bytes, status {response.status_code}")
+        return response
+
+    @server.teardown_request
+    def _drop_callback_timer(exc):
+        # after_request does not run when a request fails, so make sure no state leaks into the next one
+        _local.request = None
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(render_prometheus(cache_stats() if cache_stats else None),
+                              mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -0,0 +1,251 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_processing import (CATEGORY_COLUMNS, HISTOGRAM_BIN_WIDTH, SNAPSHOT_DIR, STALE_AFTER, remove_stale,
+                             skills_for_rows, touch)
+from metrics import timed
+
+try:
+    import duckdb
+except ImportError:  # The duckdb engine is optional; sqlite3 ships with Python
+    duckdb = None
+
+# Optional SQL backend for the filtering callbacks: the listings are exported once per dataset version into an
+# embedded database file, and the histogram, job-title and search callbacks send aggregate queries to it
+# instead of scanning DataFrames. Ingested batches are appended to a copy of the previous version's file.
+# Set DASHBOARD_QUERY_BACKEND to 'sqlite' or 'duckdb' to enable it; workers then drop the listing frames once
+# the database is written (see dataset_registry.release_row_frames).
+ENGINE = os.environ.get('DASHBOARD_QUERY_BACKEND', 'pandas')
+ENABLED = ENGINE in ('sqlite', 'duckdb')
+QUERY_DIR = os.path.join(SNAPSHOT_DIR, 'query')
+INDEXED_COLUMNS = ['des_category_level', 'des_category_domain', 'location', 'platform']
+# Listings converted to rows at a time while exporting, which bounds the extra memory an export needs
+EXPORT_CHUNK_ROWS = 100_000
+ROW_COLUMNS = ([('row_id', 'BIGINT'), ('title', 'VARCHAR'), ('salary', 'VARCHAR'), ('salary_value', 'DOUBLE'),
+                ('salary_bin', 'DOUBLE')] + [(column, 'VARCHAR') for column in INDEXED_COLUMNS]
+               + [('hard_skills', 'VARCHAR'), ('soft_skills', 'VARCHAR')])
+
+if ENGINE == 'duckdb' and duckdb is None:
+    print("DASHBOARD_QUERY_BACKEND=duckdb needs the duckdb package, falling back to sqlite")
+    ENGINE = 'sqlite'
+
+_local = threading.local()
+_lock = threading.Lock()
+_live_paths = set()  # databases of the dataset versions still in use in this process
+_renewed = {}  # database path -> when this process last touched it
+
+
+def _listing_rows(listings, skills, start=0, offset=0, bin_width=HISTOGRAM_BIN_WIDTH):
+    # Rows of the listings from position start on, at most EXPORT_CHUNK_ROWS, numbered from offset + start.
+    # What the queries need is precomputed: the salary of listings that have one with its histogram bin (the
+    # outlier filter is applied at query time, against the salary_bounds table) and the comma-joined skills
+    # shown on search cards.
+    listings = listings.iloc[start:start + EXPORT_CHUNK_ROWS]
+    row_ids = np.arange(start, start + len(listings))
+    salary = listings['salary_avg'].where(listings['salary'] != 'Not specified')
+    rows = pd.DataFrame({
+        'row_id': row_ids + offset,
+        'title': listings['title'].astype(object),
+        'salary': listings['salary'].astype(object),
+        'salary_value': salary,
+        'salary_bin': (salary // bin_width) * bin_width,
+    })
+    for column in INDEXED_COLUMNS:
+        rows[column] = listings[column].astype(object)
+    rows['hard_skills'] = skills_for_rows(skills['hard'], row_ids)
+    rows['soft_skills'] = skills_for_rows(skills['soft'], row_ids)
+    return rows.where(rows.notna(), None).reset_index(drop=True)
+
+
+def _connect(path):
+    return duckdb.connect(path) if ENGINE == 'duckdb' else sqlite3.connect(path)
+
+
+def _insert(con, listings, skills, offset=0):
+    for start in range(0, len(listings), EXPORT_CHUNK_ROWS):
+        rows = _listing_rows(listings, skills, start, offset)
+        if ENGINE == 'duckdb':
+            con.register('chunk', rows)
+            con.execute("INSERT INTO listings SELECT * FROM chunk")
+            con.unregister('chunk')
+        else:
+            rows.to_sql('listings', con, index=False, if_exists='append')
+
+
+def _set_bounds(con, bounds):
+    con.execute("DELETE FROM salary_bounds")
+    if bounds is not None:
+        con.execute("INSERT INTO salary_bounds VALUES (?, ?)", [float(bound) for bound in bounds])
+
+
+def _database_path(version, directory=QUERY_DIR):
+    # Versions local to this process get a per-process file, like the callback disk cache skips them
+    if version.startswith('local-'):
+        version = f"{version}-{os.getpid()}"
+    return os.path.join(directory, f"{version}.{ENGINE}")
+
+
+def export(listings, skills, version, bounds, directory=QUERY_DIR):
+    # Writes the database for this dataset version unless it exists already and returns its path.
+    # bounds: the salary outlier bounds, see data_processing.salary_bounds
+    path = _database_path(version, directory)
+    with _lock:
+        _live_paths.add(path)
+    if touch(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    con = _connect(tmp_path)
+    con.execute(f"CREATE TABLE listings ({', '.join(f'{name} {kind}' for name, kind in ROW_COLUMNS)})")
+    _insert(con, listings, skills)
+    for column in INDEXED_COLUMNS:
+        con.execute(f"CREATE INDEX idx_{column} ON listings ({column})")
+    for column in CATEGORY_COLUMNS:
+        con.execute(f"CREATE INDEX idx_{column}_location ON listings ({column}, location)")
+    con.execute("CREATE TABLE salary_bounds (lower_bound DOUBLE, upper_bound DOUBLE)")
+    _set_bounds(con, bounds)
+    if ENGINE == 'sqlite':
+        con.commit()
+    con.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def extend(previous_path, batch, batch_skills, offset, version, bounds, directory=QUERY_DIR):
+    # Database of the next dataset version: a copy of the previous one with the batch's rows, numbered from
+    # offset, appended and the salary bounds replaced. Only the batch is converted; the copy is a file copy.
+    path = _database_path(version, directory)
+    with _lock:
+        _live_paths.add(path)
+    if touch(path):
+        return path
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(previous_path, tmp_path)
+    con = _connect(tmp_path)
+    _insert(con, batch, batch_skills, offset)
+    _set_bounds(con, bounds)
+    if ENGINE == 'sqlite':
+        con.commit()
+    con.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def remove_unused(versions, directory=QUERY_DIR):
+    # Runs after a swap, once no request reads the old version anymore. This process's local databases of other
+    # versions are deleted; shared databases may still be served by other workers, which keep touching them, so
+    # only those nobody has touched for STALE_AFTER seconds go.
+    paths = {_database_path(version, directory) for version in versions}
+    with _lock:
+        _live_paths.intersection_update(paths)
+    keep = {os.path.basename(path) for path in paths}
+    own_suffix = f"-{os.getpid()}.{ENGINE}"
+    for entry in os.listdir(directory) if os.path.isdir(directory) else []:
+        if entry not in keep and entry.startswith('local-') and entry.endswith(own_suffix):
+            try:
+                os.remove(os.path.join(directory, entry))
+            except OSError:
+                pass
+    remove_stale(directory, keep=keep, select=lambda entry: entry.endswith(f'.{ENGINE}'))
+
+
+def _connection(path):
+    # One read-only connection per thread and database file. Connections to databases of retired versions are
+    # closed by the thread that opened them, on its next query.
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    with _lock:
+        retired = [other for other in connections if other != path and other not in _live_paths]
+    for other in retired:
+        connections.pop(other).close()
+    _renew(path)
+    if path not in connections:
+        if ENGINE == 'duckdb':
+            connections[path] = duckdb.connect(path, read_only=True)
+        else:
+            connections[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return connections[path]
+
+
+def _renew(path):
+    # Touches the database now and then, well within STALE_AFTER, so other workers' cleanup leaves it alone
+    now = time.time()
+    with _lock:
+        if now - _renewed.get(path, 0) < STALE_AFTER / 4:
+            return
+        _renewed[path] = now
+    touch(path)
+
+
+def _query(path, sql, params=()):
+    return _connection(path).execute(sql, params).fetchall()
+
+
+@timed('pandas')
+def salary_histogram(path, level=None, domain=None):
+    # Same result as query_salary_cube: listing count per salary bin
+    conditions, params = ['salary_value BETWEEN (SELECT lower_bound FROM salary_bounds) '
+                          'AND (SELECT upper_bound FROM salary_bounds)'], []
+    if level:
+        conditions.append('des_category_level = ?')
+        params.append(level)
+    if domain:
+        conditions.append('des_category_domain = ?')
+        params.append(domain)
+    rows = _query(path, f"SELECT salary_bin, COUNT(*) FROM listings WHERE {' AND '.join(conditions)} "
+                        f"GROUP BY salary_bin ORDER BY salary_bin", params)
+    return pd.Series([count for _, count in rows], index=pd.Index([float(b) for b, _ in rows], name='salary_bin'),
+                     name='count', dtype=np.int64)
+
+
+def listing_count(path):
+    return _query(path, "SELECT COUNT(*) FROM listings")[0][0]
+
+
+@timed('pandas')
+def job_title_counts(path, column, selected_category, top_N=10):
+    # Same frames as data_processing.job_title_counts
+    if column not in CATEGORY_COLUMNS:
+        raise ValueError(f"Unknown category column: {column}")
+
+    if not selected_category:
+        rows = _query(path, f"SELECT {column}, COUNT(*) AS n FROM listings WHERE {column} IS NOT NULL "
+                            f"GROUP BY {column} ORDER BY n DESC, {column}")
+        return pd.DataFrame(rows, columns=['Job Title Category', 'Count'])
+
+    rows = _query(path, f"SELECT title, COUNT(*) AS n FROM listings WHERE {column} = ? AND title IS NOT NULL "
+                        f"GROUP BY title ORDER BY n DESC, title LIMIT ?", (selected_category, top_N))
+    title_counts = pd.DataFrame(rows, columns=['Job Title', 'Count'])
+    total, distinct = _query(path, f"SELECT COUNT(title), COUNT(DISTINCT title) FROM listings WHERE {column} = ?",
+                             (selected_category,))[0]
+    if distinct > top_N:
+        others = pd.DataFrame({'Job Title': ['Others'], 'Count': [total - title_counts['Count'].sum()]})
+        title_counts = pd.concat([title_counts, others], ignore_index=True)
+    return title_counts
+
+
+_SEARCH_WHERE = "(des_category_level = ? OR des_category_domain = ?) AND location = ?"
+
+
+@timed('pandas')
+def search_count(path, job, location):
+    # A job matches on either its level or its domain category
+    return _query(path, f"SELECT COUNT(*) FROM listings WHERE {_SEARCH_WHERE}", (job, job, location))[0][0]
+
+
+@timed('pandas')
+def search_page(path, job, location, page=1, page_size=50):
+    # One 1-based page of matching listings (title, salary, skills) plus the total number of matches
+    rows = _query(path, f"SELECT title, salary, hard_skills, soft_skills FROM listings WHERE {_SEARCH_WHERE} "
+                        f"ORDER BY row_id LIMIT ? OFFSET ?", (job, job, location, page_size, (page - 1) * page_size))
+    page_rows = pd.DataFrame(rows, columns=['title', 'salary', 'hard_skills', 'soft_skills'])
+    return page_rows, search_count(path, job, location)
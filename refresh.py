@@ -0,0 +1,75 @@
+import functools
+import os
+import threading
+import time
+
+import dataset_registry
+import startup
+from data_processing import refresh_snapshot, snapshot_version
+
+# Background refresh: every REFRESH_INTERVAL seconds the source is checked with a conditional GET, and when the
+# snapshot changed the next dataset version is built in this thread: listings, aggregates, figures and exported
+# assets, i.e. the same stages as startup. The finished version is then swapped in at once; requests already
+# running finish on the version they started with (see dataset_registry.pin), and every cache keys on the
+# dataset version or artifact revisions, so nothing stale is served afterwards.
+# Set DASHBOARD_REFRESH_INTERVAL to enable it; needs pyarrow, since changes are detected by the snapshot hash.
+REFRESH_INTERVAL = float(os.environ.get('DASHBOARD_REFRESH_INTERVAL', '0'))
+# Stages are built one at a time by default, leaving the other cores to the requests being served
+REFRESH_WORKERS = int(os.environ.get('DASHBOARD_REFRESH_WORKERS', '1'))
+
+_stop = threading.Event()
+
+
+def _in_state(state, func):
+    with dataset_registry.pinned(state):
+        return func()
+
+
+def refresh_once(stages, targets=None, max_workers=REFRESH_WORKERS):
+    # Returns True when a new dataset version was swapped in
+    try:
+        refresh_snapshot(read=False)
+    except Exception as e:
+        print(f"Error checking dataset source: {e}")
+        return False
+    source = snapshot_version()
+    if source is None or source == dataset_registry.source():
+        return False
+
+    started = time.perf_counter()
+    state = dataset_registry.staging()
+    staged = {name: (depends, functools.partial(_in_state, state, func)) for name, (depends, func) in stages.items()}
+    try:
+        startup.run(staged, targets=targets, max_workers=max_workers)
+        if not startup.DEFER_STARTUP:
+            _in_state(state, dataset_registry.release_row_frames)
+    except Exception:
+        dataset_registry.discard(state)
+        raise
+    # Files of the old version are cleaned up once the last request reading it is done, see dataset_registry
+    dataset_registry.swap(state)
+    print(f"Swapped in dataset version {state['version']} after {time.perf_counter() - started:.2f}s")
+    return True
+
+
+def _loop(stages, targets, interval):
+    while not _stop.wait(interval):
+        try:
+            refresh_once(stages, targets)
+        except Exception as e:
+            # The live version keeps being served; the next run starts from scratch
+            print(f"Error refreshing dataset: {e}")
+
+
+def start(stages, targets=None, interval=REFRESH_INTERVAL):
+    # Starts the refresh thread unless interval is 0; it is a daemon, so it never holds up shutdown
+    if interval <= 0:
+        return None
+    _stop.clear()
+    thread = threading.Thread(target=_loop, args=(stages, targets, interval), name='dataset-refresh', daemon=True)
+    thread.start()
+    return thread
+
+
+def stop():
+    _stop.set()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The dashboard modules live at the repository root and the synthetic listings generator in benchmarks/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'benchmarks')]
+
+from synthetic import generate_listings  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def raw_listings():
+    return generate_listings(6000, seed=3)
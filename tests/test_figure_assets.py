@@ -0,0 +1,29 @@
+import dash
+import pytest
+
+import dataset_registry
+import figure_assets
+
+FIGURES = {'platform': lambda: {'data': [{'type': 'bar', 'x': sorted(dataset_registry.get('platform_counts'))}]}}
+DEPENDENCIES = {'platform': ['platform_counts']}
+
+
+@pytest.fixture
+def registry(monkeypatch, raw_listings):
+    snapshot = raw_listings.iloc[:5000].copy()
+    snapshot.attrs['snapshot_version'] = 'snapshot'
+    monkeypatch.setattr(dataset_registry, 'load_data', lambda refresh=False: snapshot)
+    dataset_registry.clear()
+    yield
+    dataset_registry.clear()
+
+
+def test_layout_urls_cover_exported_figures_only(registry, tmp_path):
+    app = dash.Dash(__name__)
+    assert figure_assets.urls(app, FIGURES, DEPENDENCIES, str(tmp_path)) == {}
+    # Listing the URLs never builds what the figures depend on
+    assert 'platform_counts' not in dataset_registry._state()['artifacts']
+
+    filename = figure_assets.export_figure('platform', FIGURES['platform'], DEPENDENCIES['platform'], str(tmp_path))
+    assert figure_assets.urls(app, FIGURES, DEPENDENCIES, str(tmp_path)) == {
+        'platform': app.get_relative_path(figure_assets.URL_PREFIX + filename)}
@@ -0,0 +1,100 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_registry
+from data_processing import (HISTOGRAM_BIN_WIDTH, count_listings, merge_listing_counts, normalize_skills,
+                             prepare_listings, process_data_optimized, query_salary_cube)
+
+AGGREGATES = ['skill_rankings', 'state_aggregates', 'platform_counts', 'salary_range_counts', 'salary_stats',
+              'salary_cube', 'search_index', 'location_options']
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Loads raw as the listings of the snapshot 'snapshot'
+    def load(raw):
+        raw = raw.reset_index(drop=True)
+        raw.attrs['snapshot_version'] = 'snapshot'
+        monkeypatch.setattr(dataset_registry, 'load_data', lambda refresh=False: raw)
+        dataset_registry.clear()
+
+    yield load
+    dataset_registry.clear()
+
+
+def _built(names):
+    return {name: dataset_registry.get(name) for name in names}
+
+
+def _assert_same(name, actual, expected):
+    if name == 'search_index':
+        assert actual.keys() == expected.keys()
+        for key in expected:
+            np.testing.assert_array_equal(actual[key], expected[key])
+    elif name == 'salary_cube':
+        columns = list(expected.columns[:3])
+        pd.testing.assert_frame_equal(actual.sort_values(columns).reset_index(drop=True),
+                                      expected.sort_values(columns).reset_index(drop=True))
+    else:
+        assert dataset_registry._same(actual, expected), name
+
+
+def test_ingest_matches_full_rebuild(registry, raw_listings):
+    registry(raw_listings)
+    expected = _built(AGGREGATES)
+
+    registry(raw_listings.iloc[:4500].reset_index(drop=True))
+    _built(AGGREGATES)
+    # Overlaps the loaded listings and repeats rows within the batch; only the 1500 new listings are added
+    batch = pd.concat([raw_listings.iloc[4000:], raw_listings.iloc[5000:5100]])
+    assert dataset_registry.ingest(batch) == 1500
+    assert dataset_registry.ingest(batch) == 0
+
+    assert len(dataset_registry.get('listings')) == len(raw_listings)
+    for name, artifact in _built(AGGREGATES).items():
+        _assert_same(name, artifact, expected[name])
+
+
+def test_salary_cube_matches_processed_listings(registry, raw_listings):
+    registry(raw_listings)
+    listings = dataset_registry.get('listings')
+    processed = process_data_optimized(listings[listings['salary'] != 'Not specified'])
+    levels = [None] + list(listings['des_category_level'].dropna().unique()[:2])
+    domains = [None] + list(listings['des_category_domain'].dropna().unique()[:2])
+    for level in levels:
+        for domain in domains:
+            # The histogram binned straight from the processed listings
+            selected = processed[processed['des_category_level'] == level] if level else processed
+            selected = selected[selected['des_category_domain'] == domain] if domain else selected
+            expected = selected.groupby(selected['avg_salary'] // HISTOGRAM_BIN_WIDTH * HISTOGRAM_BIN_WIDTH).size()
+            pd.testing.assert_series_equal(query_salary_cube(dataset_registry.get('salary_cube'), level, domain),
+                                           expected.rename_axis('salary_bin'), check_names=False)
+
+
+def test_ingest_keeps_revisions_of_unchanged_artifacts(registry, raw_listings):
+    registry(raw_listings.iloc[:5000].reset_index(drop=True))
+    cube_revision = dataset_registry.revision(['salary_cube'])
+    index_revision = dataset_registry.revision(['search_index'])
+    version = dataset_registry.version()
+
+    # Listings without a salary leave the cube as it is, so callbacks memoized on it stay cached
+    batch = raw_listings.iloc[5000:].assign(salary='Not specified')
+    assert dataset_registry.ingest(batch) == len(batch)
+    assert dataset_registry.version() != version
+    assert dataset_registry.revision(['salary_cube']) == cube_revision
+    assert dataset_registry.revision(['search_index']) != index_revision
+
+
+def test_merging_batch_counts_does_not_warn(raw_listings):
+    # Listings without a level or domain are counted alongside the named categories
+    counts = []
+    for part in [raw_listings.iloc[:5000], raw_listings.iloc[5000:]]:
+        listings = prepare_listings(part)
+        counts.append(count_listings(listings, normalize_skills(listings)[0]))
+    assert counts[0]['cube_salary'].index.get_level_values('des_category_level').isna().sum() == 0
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        merge_listing_counts(*counts)
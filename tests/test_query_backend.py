@@ -0,0 +1,110 @@
+import pandas as pd
+import pytest
+
+import dataset_registry
+import query_backend
+from data_processing import (count_listings, des_categories_by_domain, des_categories_by_level, job_title_counts,
+                             normalize_skills, prepare_listings, query_salary_cube, salary_bounds,
+                             salary_cube_from_counts)
+
+ENGINES = ['sqlite'] + (['duckdb'] if query_backend.duckdb is not None else [])
+CATEGORIES = [('des_category_level', [None, *des_categories_by_level]),
+              ('des_category_domain', [None, *des_categories_by_domain])]
+SEARCHES = [(job, location) for job in ['Junior Data Analysts', 'BI Data Analysts'] for location in
+            ['Anywhere', 'Remote']]
+
+
+@pytest.fixture(scope='module')
+def listings(raw_listings):
+    listings = prepare_listings(raw_listings)
+    skills, _ = normalize_skills(listings)
+    return listings, skills
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request, monkeypatch):
+    monkeypatch.setattr(query_backend, 'ENGINE', request.param)
+    return request.param
+
+
+def _export(listings, skills, version, directory):
+    bounds = salary_bounds(count_listings(listings, skills)['cube_salary'])
+    return query_backend.export(listings, skills, version, bounds, directory)
+
+
+@pytest.fixture
+def database(engine, tmp_path, listings):
+    return _export(*listings, 'test', tmp_path)
+
+
+def test_job_title_counts_match_pandas(database, listings):
+    for column, categories in CATEGORIES:
+        for category in categories:
+            expected = job_title_counts(listings[0], column, category)
+            actual = query_backend.job_title_counts(database, column, category)
+            assert actual.values.tolist() == expected.values.tolist(), (column, category)
+
+
+def test_salary_histogram_matches_cube(database, listings):
+    cube = salary_cube_from_counts(count_listings(*listings)['cube_salary'])
+    for level in [None, *des_categories_by_level]:
+        for domain in [None, 'BI Data Analysts']:
+            pd.testing.assert_series_equal(query_backend.salary_histogram(database, level, domain),
+                                           query_salary_cube(cube, level, domain), check_index_type=False)
+
+
+def test_extended_database_matches_full_export(engine, tmp_path, listings, monkeypatch):
+    monkeypatch.setattr(query_backend, 'EXPORT_CHUNK_ROWS', 1000)  # several chunks per export
+    full = _export(*listings, 'full', tmp_path)
+
+    head = listings[0].iloc[:4500]
+    head_skills, _ = normalize_skills(head)
+    batch = listings[0].iloc[4500:].reset_index(drop=True)
+    batch_skills, _ = normalize_skills(batch)
+    bounds = salary_bounds(count_listings(*listings)['cube_salary'])
+    extended = query_backend.extend(_export(head, head_skills, 'head', tmp_path), batch, batch_skills, 4500,
+                                    'extended', bounds, tmp_path)
+
+    assert query_backend.listing_count(extended) == len(listings[0])
+    for level in [None, *des_categories_by_level]:
+        pd.testing.assert_series_equal(query_backend.salary_histogram(extended, level),
+                                       query_backend.salary_histogram(full, level))
+    for column, categories in CATEGORIES:
+        for category in categories:
+            pd.testing.assert_frame_equal(query_backend.job_title_counts(extended, column, category),
+                                          query_backend.job_title_counts(full, column, category))
+    for job, location in SEARCHES:
+        for page in [1, 2]:
+            pd.testing.assert_frame_equal(query_backend.search_page(extended, job, location, page)[0],
+                                          query_backend.search_page(full, job, location, page)[0])
+
+
+def test_workers_drop_row_frames_and_keep_ingesting(engine, tmp_path, raw_listings, monkeypatch):
+    monkeypatch.setattr(query_backend, 'ENABLED', True)
+    monkeypatch.setattr(query_backend, 'QUERY_DIR', str(tmp_path))
+    monkeypatch.setitem(dataset_registry._builders, 'query_db', lambda: query_backend.export(
+        dataset_registry.get('listings'), dataset_registry.get('skills'), dataset_registry.version(),
+        salary_bounds(dataset_registry.get('listing_counts')['cube_salary']), str(tmp_path)))
+    monkeypatch.setitem(dataset_registry._dependencies, 'query_db', ('listings', 'skills', 'listing_counts'))
+    snapshot = raw_listings.iloc[:5000].reset_index(drop=True)
+    monkeypatch.setattr(dataset_registry, 'load_data', lambda refresh=False: snapshot)
+    dataset_registry.clear()
+    try:
+        version = dataset_registry.version()
+        dataset_registry.release_row_frames()
+        assert 'listings' not in dataset_registry.memory_report()
+        assert dataset_registry.version() == version
+        with pytest.raises(RuntimeError):
+            dataset_registry.get('listings')
+
+        assert dataset_registry.ingest(raw_listings.iloc[5000:]) == len(raw_listings) - 5000
+        assert 'skills' not in dataset_registry.memory_report()
+        database = dataset_registry.get('query_db')
+        assert query_backend.listing_count(database) == len(raw_listings)
+        listings = prepare_listings(raw_listings)
+        for column, categories in CATEGORIES:
+            for category in categories:
+                assert query_backend.job_title_counts(database, column, category).values.tolist() == (
+                    job_title_counts(listings, column, category).values.tolist())
+    finally:
+        dataset_registry.clear()
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import dataset_registry
+
+
+@pytest.fixture
+def registry(monkeypatch, raw_listings):
+    snapshot = raw_listings.iloc[:5000].copy()
+    snapshot.attrs['snapshot_version'] = 'snapshot'
+    monkeypatch.setattr(dataset_registry, 'load_data', lambda refresh=False: snapshot)
+    dataset_registry.clear()
+    yield
+    dataset_registry.clear()
+
+
+def test_requests_pin_while_a_batch_is_ingested(registry, raw_listings, monkeypatch):
+    ingested = dataset_registry._ingested
+    pinned = []
+
+    def ingested_with_request(current, batch):
+        # A request starting mid-ingest must not wait for it
+        def request():
+            with dataset_registry.pinned():
+                pinned.append(True)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join(timeout=5)
+        return ingested(current, batch)
+
+    monkeypatch.setattr(dataset_registry, '_ingested', ingested_with_request)
+    assert dataset_registry.ingest(raw_listings.iloc[5000:]) == len(raw_listings) - 5000
+    assert pinned == [True]
+
+
+def test_ingest_lands_on_a_version_swapped_in_meanwhile(registry, raw_listings, monkeypatch):
+    ingested = dataset_registry._ingested
+    refreshed = []
+
+    def ingested_during_refresh(current, batch):
+        result = ingested(current, batch)
+        if not refreshed:
+            # A refresh swaps in a reloaded snapshot before the ingest is done
+            state = dataset_registry.staging()
+            with dataset_registry.pinned(state):
+                dataset_registry.get('listings')
+            dataset_registry.swap(state)
+            refreshed.append(state)
+        return result
+
+    monkeypatch.setattr(dataset_registry, '_ingested', ingested_during_refresh)
+    batch = raw_listings.iloc[5000:]
+    assert dataset_registry.ingest(batch) == len(batch)
+    assert dataset_registry._current is not refreshed[0]
+    assert len(dataset_registry.get('listings')) == len(raw_listings)
+
+
+def test_shared_artifacts_are_read_only(registry):
+    listings = dataset_registry.view('listings')
+    with pytest.raises(ValueError):
+        listings.loc[0, 'salary_avg'] = 0
+    with pytest.raises(ValueError):
+        dataset_registry.get('skills')['hard'].iloc[0, 0] = 0
+    with pytest.raises(ValueError):
+        next(iter(dataset_registry.get('search_index').values()))[0] = 0
+
+    # Replacing a column of the view leaves the shared frame as it is
+    listings['salary_avg'] = 0
+    assert not (dataset_registry.get('listings')['salary_avg'] == 0).all()
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing import map_salary_to_range, parse_salaries
+
+SALARIES = [
+    ('50,000-70,000 a year', 60000.0, 'year', '50k-75k'),
+    ('$60,000 - $80,000 a year', 70000.0, 'year', '50k-75k'),
+    ('80,000 a year', 80000.0, 'year', '75k-100k'),
+    ('$95,000.00 per year', 95000.0, 'year', '75k-100k'),
+    ('Up to $80,000 a year', 80000.0, 'year', '75k-100k'),
+    ('From $50,000 a year', 50000.0, 'year', '50k-75k'),
+    ('25-30 an hour', 27.5, 'hour', 'Other'),
+    ('From $20 an hour', 20.0, 'hour', 'Other'),
+    ('Competitive', np.nan, None, 'Other'),
+    ('Not specified', np.nan, None, None),
+]
+
+
+def _values(column):
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+def test_parse_salaries():
+    parsed = parse_salaries(pd.DataFrame({'salary': [salary for salary, *_ in SALARIES]}))
+    np.testing.assert_array_equal(parsed['salary_avg'].to_numpy(), [avg for _, avg, _, _ in SALARIES])
+    assert _values(parsed['salary_period']) == [period for _, _, period, _ in SALARIES]
+    assert _values(parsed['salary_range']) == [salary_range for *_, salary_range in SALARIES]
+
+
+@pytest.mark.parametrize('salary, avg, period, salary_range', SALARIES)
+def test_map_salary_to_range(salary, avg, period, salary_range):
+    assert map_salary_to_range(salary) == salary_range
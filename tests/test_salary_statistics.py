@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processing import (SALARY_PERCENTILES, count_locations, count_salaries, normalize_locations,
+                             prepare_listings, quantile_from_counts, salary_percentiles, salary_statistics)
+
+
+@pytest.fixture(scope='module')
+def listings(raw_listings):
+    return prepare_listings(raw_listings)
+
+
+def _yearly_salaries(listings, groups):
+    salary = listings['salary_avg'].where(listings['salary_period'] == 'year')
+    return pd.DataFrame({'group': groups, 'salary': salary}).dropna()
+
+
+@pytest.mark.parametrize('column', ['des_category_level', 'des_category_domain'])
+def test_salary_percentiles_match_groupby_quantile(listings, column):
+    stats = salary_percentiles(count_salaries(listings)[f'{column}_salary'])
+
+    salaries = _yearly_salaries(listings, listings[column].astype(object)).groupby('group')['salary']
+    expected = salaries.quantile(SALARY_PERCENTILES).unstack()
+    expected.columns = [f'p{round(q * 100)}' for q in SALARY_PERCENTILES]
+    expected.insert(0, 'count', salaries.size())
+
+    stats = stats.sort_index()
+    assert list(stats.index) == list(expected.index)
+    assert stats['count'].tolist() == expected['count'].tolist()
+    np.testing.assert_allclose(stats.drop(columns='count').to_numpy(), expected.drop(columns='count').to_numpy())
+
+
+def test_salary_statistics_by_state(listings):
+    counts = {**count_salaries(listings), **count_locations(listings)}
+    stats = salary_statistics(counts)['state'].sort_index()
+
+    states = normalize_locations(listings['location'])['state']
+    expected = _yearly_salaries(listings, states).groupby('group')['salary'].median()
+    np.testing.assert_allclose(stats['p50'].to_numpy(), expected.sort_index().to_numpy())
+
+
+def test_salary_percentiles_without_salaries():
+    empty = pd.Series([], dtype=np.int64, index=pd.MultiIndex.from_arrays([[], []], names=['group', 'salary']))
+    stats = salary_percentiles(empty)
+    assert stats.empty
+    assert list(stats.columns) == ['count'] + [f'p{round(q * 100)}' for q in SALARY_PERCENTILES]
+
+
+@pytest.mark.parametrize('q', [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1])
+def test_quantile_from_counts_matches_series_quantile(q):
+    rng = np.random.default_rng(7)
+    values = pd.Series(rng.choice([35000.0, 52000.0, 52500.0, 80000.0, 120000.0, 250000.0], size=501))
+    assert quantile_from_counts(values.value_counts(), q) == pytest.approx(values.quantile(q))
+
+
+def test_quantile_from_counts_of_one_value():
+    assert quantile_from_counts(pd.Series({60000.0: 4}), 0.75) == 60000.0
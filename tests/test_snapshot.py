@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import data_processing
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def snapshot_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(data_processing, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(data_processing, 'SNAPSHOT_PATH', str(tmp_path / 'listings.feather'))
+    monkeypatch.setattr(data_processing, 'SNAPSHOT_META_PATH', str(tmp_path / 'listings.json'))
+    return tmp_path
+
+
+def test_snapshot_carries_its_version(snapshot_dir, raw_listings):
+    assert data_processing.snapshot_version() is None
+    data_processing.write_snapshot(raw_listings.iloc[:100], {'sha256': 'abc'})
+
+    df = data_processing.read_snapshot()
+    assert df.attrs['snapshot_version'] == data_processing.snapshot_version() == 'abc'
+    assert df.equals(raw_listings.iloc[:100].reset_index(drop=True))
+    assert sorted(os.listdir(snapshot_dir)) == ['listings.feather', 'listings.json']
+
+
+def test_snapshot_version_follows_the_data(snapshot_dir, raw_listings):
+    data_processing.write_snapshot(raw_listings.iloc[:100], {'sha256': 'abc'})
+    # The meta file alone never changes the version the snapshot's data is read with
+    data_processing._write_snapshot_meta({'sha256': 'def'})
+    assert data_processing.read_snapshot().attrs['snapshot_version'] == 'abc'
+    assert data_processing.snapshot_version() == 'abc'
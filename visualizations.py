@@ -1,57 +1,51 @@
-from dash import dash_table
-import plotly.express as px
-import plotly.graph_objects as go
-
-from data_processing import map_salary_to_range
-
-
-def create_histograms(df_processed):
-    fig = px.histogram(
-        df_processed,
-        x="avg_salary",
-        color="des_category_level",
-        title="Salary Distribution by Job Level",
-        labels={"avg_salary": "Average Salary", "des_category_level": "Level"},
-        category_orders={
-            "des_category_level": [
-                "Junior Data Analysts",
-                "Senior Data Analysts",
-                "Lead Data Analysts",
-            ]
-        },
-        barmode="overlay",
-    )
-    fig.update_traces(opacity=0.8)
-
-    fig_domain = px.histogram(
-        df_processed,
-        x="avg_salary",
-        color="des_category_domain",
-        title="Salary Distribution by Job Domain",
-        labels={"avg_salary": "Average Salary", "des_category_domain": "Domain"},
-        barmode="overlay",
-    )
-    fig_domain.update_traces(opacity=0.8)
-
+from data_processing import HISTOGRAM_BIN_WIDTH, SALARY_LABELS
+from metrics import timed
+
+# plotly.express, plotly.graph_objects and dash_table are imported inside the builders that use them,
+# so importing this module stays cheap and workers only pay for the figure types they actually build
+
+
+@timed('figure')
+def create_salary_histogram(bin_counts, title, bin_width=HISTOGRAM_BIN_WIDTH):
+    # Histogram drawn from pre-binned counts, so the payload has one bar per bin rather than one point per listing
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(
+        x=bin_counts.index + bin_width / 2,
+        y=bin_counts.values,
+        width=bin_width,
+        marker_color="#00CC96",
+        opacity=0.8,
+    ))
+
+    # Update layout to match the dark theme
     fig.update_layout(
-        paper_bgcolor="#282c31",  # Background outside the plot
-        plot_bgcolor="#282c31",  # Background inside the plot
-        font=dict(color="#e9ecef"),  # Font color
-    )
-    fig_domain.update_layout(
+        title_text=title,
         paper_bgcolor="#282c31",
         plot_bgcolor="#282c31",
         font=dict(color="#e9ecef"),
+        bargap=0,
+        xaxis=dict(
+            title_text="Average Salary",
+            gridcolor="#4f545a",  # Lighter than the plot background, but darker than text
+            zerolinecolor="#4f545a"
+        ),
+        yaxis=dict(
+            title_text="count",
+            gridcolor="#4f545a",
+            zerolinecolor="#4f545a"
+        ),
     )
-
-    return fig, fig_domain
+    return fig
 
 
-def create_platform_pie(df):
-    top_N = 6
-    top_platforms = df['platform'].value_counts().index[:top_N]
-    df.loc[:, 'grouped_platform'] = df['platform'].apply(lambda x: x if x in top_platforms else 'Others')
-    grouped_platform_counts = df['grouped_platform'].value_counts().reset_index()
+@timed('figure')
+def create_platform_pie(platform_counts, top_N=6):
+    # Keep the top_N platforms and fold the rest into 'Others', without touching the caller's data
+    import plotly.express as px
+    platform_counts = platform_counts[platform_counts > 0].sort_values(ascending=False, kind='stable')
+    platforms = platform_counts.index.astype(object)
+    grouped = platform_counts.groupby(platforms.where(platforms.isin(platforms[:top_N]), 'Others'), sort=False).sum()
+    grouped_platform_counts = grouped.sort_values(ascending=False, kind='stable').reset_index()
     grouped_platform_counts.columns = ['Platform', 'Count']
 
     fig_platform = px.pie(
@@ -66,33 +60,25 @@ def create_platform_pie(df):
         pull=[0.1 if platform == 'Others' else 0 for platform in grouped_platform_counts['Platform']]
         # adjust this value to control the pie size
     )
+    fig_platform.update_layout(
+        paper_bgcolor="#282c31",
+        plot_bgcolor="#282c31",
+        font=dict(color="#e9ecef"),
+    )
 
     return fig_platform
 
 
-def create_job_title_bar_chart(df, column, selected_category, categories):
+@timed('figure')
+def create_job_title_bar_chart(title_counts, selected_category):
+    # title_counts as returned by job_title_counts: per category, or per title within selected_category
+    import plotly.express as px
     if selected_category:
-        filtered_df = df[df[column] == selected_category]
-        title_counts = filtered_df['title'].value_counts().reset_index()
-        title_counts.columns = ['Job Title', 'Count']
-        title_counts.sort_values(by='Count', ascending=False, inplace=True)
-
-        # Limit to top N job titles and group the rest into 'Others'
-        top_N = 10  # Adjust this number based on your preference
-        if len(title_counts) > top_N:
-            other_count = title_counts[top_N:]['Count'].sum()
-            title_counts = title_counts[:top_N]
-            title_counts.loc[len(title_counts)] = ['Others', other_count]  # Using loc to add a new row
-
         fig = px.bar(title_counts, y='Job Title', x='Count', orientation='h',
                      labels={'y': 'Job Title', 'x': 'Count'})
         fig.update_layout(title_text=f"Top Job Titles in Category: {selected_category}")
     else:
-        title_category_counts = df[column].value_counts().reset_index()
-        title_category_counts.columns = ['Job Title Category', 'Count']
-        title_category_counts.sort_values(by='Count', ascending=False, inplace=True)
-
-        fig = px.bar(title_category_counts, x='Job Title Category', y='Count',
+        fig = px.bar(title_counts, x='Job Title Category', y='Count',
                      labels={'x': 'Job Title Category', 'y': 'Count'})
         fig.update_layout(title_text="Job Title Category Distribution")
 
@@ -125,28 +111,20 @@ def create_job_title_bar_chart(df, column, selected_category, categories):
     return fig
 
 
-def generate_choropleth_map(df):
-    # Remove 'Anywhere' and 'United States' rows
-    df = df[~df['location'].isin(['Anywhere', 'United States'])].copy()
-
-    # Use regex to extract state abbreviation
-    df.loc[:, 'state'] = df.loc[:, 'location'].str.extract(r',\s*([A-Z]{2})$')[0]
-    # Count the occurrences of each state
-    state_counts = df['state'].value_counts()
-
-    # Reset index and rename columns for clarity
-    state_counts_df = state_counts.reset_index()
-    state_counts_df.columns = ['state', 'count']
-
-    # Create the choropleth map
-    fig = px.choropleth(state_counts_df,
+@timed('figure')
+def generate_choropleth_map(state_aggregates):
+    # Built from the per-state aggregates (count, median yearly salary, top domain)
+    import plotly.express as px
+    fig = px.choropleth(state_aggregates,
                         locations='state',
                         color='count',
                         locationmode='USA-states',
                         scope='usa',
                         title='Job Distributions across USA',
                         color_continuous_scale=px.colors.sequential.Blues,
-                        labels={'count': 'Number of Listings'}
+                        labels={'count': 'Number of Listings', 'median_salary': 'Median Salary',
+                                'top_domain': 'Top Domain'},
+                        hover_data={'state': True, 'count': True, 'median_salary': ':$,.0f', 'top_domain': True}
                         )
 
     fig.update_layout(
@@ -166,7 +144,9 @@ def generate_choropleth_map(df):
     return fig
 
 
+@timed('figure')
 def create_skill_table(df, skill_type, category_column):
+    from dash import dash_table
     tables = {}
     for _, row in df.iterrows():
         category = row[category_column]
@@ -221,13 +201,11 @@ def create_skill_table(df, skill_type, category_column):
     return tables
 
 
-def create_salary_bar_chart(df):
-    df['salary_range'] = df['salary'].apply(map_salary_to_range)
-    df_filtered = df[df['salary_range'].notna()]
-
-    salary_order = ["<50k", "50k-75k", "75k-100k", "100k-125k", "125k-150k", "150k-175k", "175k-200k", "200k+"]
-
-    salary_distribution = df_filtered['salary_range'].value_counts().reindex(salary_order).reset_index()
+@timed('figure')
+def create_salary_bar_chart(salary_range_counts):
+    # Counts per bucket from the load-time salary parsing stage; buckets outside SALARY_LABELS are not shown
+    import plotly.express as px
+    salary_distribution = salary_range_counts.reindex(SALARY_LABELS).reset_index()
     salary_distribution.columns = ['Salary Range', 'Job Count']
 
     fig_salary_ranges = px.bar(salary_distribution,
@@ -260,4 +238,13 @@ def create_salary_bar_chart(df):
     return fig_salary_ranges
 
 
-
+@timed('figure')
+def create_skill_pie(skill_counts, title, colors):
+    import plotly.express as px
+    fig = px.pie(skill_counts, names='Skill', values='Count', title=title)
+    fig.update_traces(marker=dict(colors=colors))
+    fig.update_layout(
+        paper_bgcolor="#282c31",
+        font=dict(color="#e9ecef")
+    )
+    return fig